@@ -0,0 +1,236 @@
+"""
+Microbenchmarks for the on_message hot path, driven by lightweight fakes of discord.Message (no network).
+
+Measures each stage on its own (forbidden-word scan, link filter, leveling update, persistence,
+quiz answer check) and the whole on_message handler, across user counts, word list sizes,
+allowlist sizes and message lengths. Results are printed and written as JSON.
+
+Usage:
+    python benchmarks/bench_hot_path.py                      # default scales, writes bench_results.json
+    python benchmarks/bench_hot_path.py --quick              # small scales, for a smoke run
+    python benchmarks/bench_hot_path.py --users 1000 100000 --words 3 5000 --output results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discord  # noqa: E402
+import turbo  # noqa: E402
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.shard_id = 0
+        self.text_channels = []  # No #📬logs or #📈level: nothing is ever sent
+        self.roles = []
+
+    def get_channel(self, channel_id):
+        return None
+
+class FakeChannel:
+    def __init__(self, channel_id, guild, name="general"):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+
+    async def send(self, *args, **kwargs):
+        pass
+
+    async def delete_messages(self, messages):
+        pass
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+class FakeMessage:
+    """Just the attributes on_message and the command parser read."""
+
+    _state = None
+
+    def __init__(self, message_id, content, author, channel):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.created_at = discord.utils.utcnow()
+        self.edited_at = None
+
+    async def delete(self):
+        pass
+
+def random_word(rng, low=3, high=9):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+def make_contents(rng, length, count, bad_ratio=0.05):
+    """Chat-like messages; a few carry a link, a few an off-list link."""
+    vocabulary = [random_word(rng) for _ in range(400)]
+    contents = []
+    for _ in range(count):
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(rng.choice(vocabulary))
+        roll = rng.random()
+        if roll < bad_ratio:
+            words[len(words) // 2] = f"https://{random_word(rng)}.example/{random_word(rng)}"
+        elif roll < 2 * bad_ratio:
+            words[len(words) // 2] = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+        contents.append(" ".join(words)[:max(length, 60)])
+    return contents
+
+def make_store(user_count, directory, rng):
+    store = turbo.JsonLevelsBackend(path=os.path.join(directory, "levels.json"), interval=3600, threshold=10**12)
+    store.data = {}
+    for user_id in range(user_count):
+        points = int(rng.paretovariate(1.3) * 5)
+        store.data[str(user_id)] = {"points": points, "level": turbo.calculate_level(points)}
+    store.ranks = turbo.RankIndex((user_id, record["points"]) for user_id, record in store.data.items())
+    return store
+
+def timed(func, items, min_time=0.2):
+    """Run func over items (cycling) for at least min_time seconds; return ops/sec."""
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for item in items:
+            func(item)
+        count += len(items)
+        elapsed = time.perf_counter() - start
+    return count / elapsed
+
+async def timed_async(func, items, min_time=0.2):
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for item in items:
+            await func(item)
+        count += len(items)
+        elapsed = time.perf_counter() - start
+    return count / elapsed
+
+async def run(args):
+    rng = random.Random(args.seed)
+    results = []
+
+    def record(stage, ops_per_sec, **params):
+        results.append({"stage": stage, "params": params, "ops_per_sec": round(ops_per_sec, 1), "us_per_op": round(1e6 / ops_per_sec, 3)})
+        shown = " ".join(f"{key}={value}" for key, value in params.items())
+        print(f"{stage:<14} {shown:<52} {ops_per_sec:>12.0f} ops/s {1e6 / ops_per_sec:>10.2f} us/op")
+
+    guild = FakeGuild(1)
+    channel = FakeChannel(10, guild)
+    quiz_channel = FakeChannel(11, guild, turbo.quiz_channel_name)
+    turbo.bot._connection.user = FakeAuthor(0)  # process_commands compares authors with the bot's own user
+    turbo.metrics.enabled = args.metrics
+    base_domains = set(turbo.ALLOWED_DOMAINS)
+
+    # Stage: forbidden-word scan
+    for word_count, length in itertools.product(args.words, args.lengths):
+        matcher = turbo.WordMatcher(random_word(rng, 5, 12) for _ in range(word_count))
+        contents = make_contents(rng, length, 200)
+        record("moderation", timed(matcher.find, contents, args.min_time), words=word_count, length=length)
+
+    # Stage: link filter
+    for domain_count, length in itertools.product(args.domains, args.lengths):
+        turbo.ALLOWED_DOMAINS.clear()
+        turbo.ALLOWED_DOMAINS.update(base_domains)
+        turbo.ALLOWED_DOMAINS.update(f"{random_word(rng)}.{random_word(rng, 2, 3)}" for _ in range(domain_count - len(base_domains)))
+        contents = make_contents(rng, length, 200, bad_ratio=0.25)
+        record("links", timed(turbo.find_unauthorized_link, contents, args.min_time), domains=len(turbo.ALLOWED_DOMAINS), length=length)
+    turbo.ALLOWED_DOMAINS.clear()
+    turbo.ALLOWED_DOMAINS.update(base_domains)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for user_count in args.users:
+            store = make_store(user_count, directory, rng)
+            active = [str(rng.randrange(user_count)) for _ in range(1000)]
+
+            # Stage: leveling update (points, level check, rank index)
+            async def level_up(user_id):
+                record_ = await store.add_points(user_id)
+                new_level = turbo.calculate_level(record_["points"])
+                if new_level > record_["level"]:
+                    await store.set_level(user_id, new_level)
+            record("leveling", await timed_async(level_up, active, args.min_time), users=user_count)
+
+            # Stage: persistence, the background flush that add_points defers to
+            store.dirty = 1
+            start = time.perf_counter()
+            await store.flush()
+            record("persistence", 1 / (time.perf_counter() - start), users=user_count, file_kb=os.path.getsize(store.path) // 1024)
+
+            # Whole handler, for every message length and word list size
+            turbo.levels_store = store
+            message_ids = itertools.count(1)
+            for word_count, length in itertools.product(args.words, args.lengths):
+                turbo.forbidden_words.update(turbo.FORBIDDEN_WORDS | {random_word(rng, 5, 12) for _ in range(word_count - len(turbo.FORBIDDEN_WORDS))})
+                contents = make_contents(rng, length, 200)
+                messages = [FakeMessage(next(message_ids), content, FakeAuthor(int(rng.choice(active))), channel) for content in contents]
+                record("on_message", await timed_async(turbo.on_message, messages, args.min_time), users=user_count, words=word_count, length=length)
+            turbo.forbidden_words.update(turbo.FORBIDDEN_WORDS)
+
+    # Stage: quiz answer check in a channel with a running quiz
+    session = turbo.quiz_manager.start(quiz_channel)
+    # Sanity check before timing: a numeric answer typed as text wins even when it is also an option number
+    session.questions.append({"question": "2 + 2?", "answer": "4", "options": ["4", "3", "5", "22"]})
+    session.next_question()
+    assert session.answer("1", "4") is turbo.QuizSession.CORRECT, "numeric answer marked wrong"
+    session.questions.append({"question": "Capital of France?", "answer": "paris", "options": ["london", "paris", "rome", "madrid"]})
+    session.next_question()
+    replies = ["rome", "2", "paris", " Paris ", "9", "I think it's london"]
+    def check(reply):
+        session.answer("1", reply)
+        session.current = session.current or {"answer": "paris"}  # Keep the question open for the next reply
+    record("quiz", timed(check, replies, args.min_time))
+    turbo.quiz_manager.end(quiz_channel)
+
+    await asyncio.sleep(turbo.deletion_queue.window + 0.1)  # Let queued deletions and logs drain against the fakes
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--words", type=int, nargs="+", default=[3, 1_000])
+    parser.add_argument("--domains", type=int, nargs="+", default=[2, 1_000])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[40, 400])
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metrics", action="store_true", help="measure with latency instrumentation enabled")
+    parser.add_argument("--quick", action="store_true", help="small scales for a smoke run")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    if args.quick:
+        args.users, args.words, args.domains, args.lengths, args.min_time = [1_000], [3, 200], [2, 200], [40], 0.05
+
+    results = asyncio.run(run(args))
+    report = {
+        "benchmark": "hot_path",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "discord_py": discord.__version__,
+        "metrics_enabled": args.metrics,
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares the RankIndex used by !leaderboard and !mon_niveau with sorting every user.
+Usage: python benchmarks/bench_leaderboard.py [user counts...]   (default: 10000 100000 1000000)
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from turbo import RankIndex  # noqa: E402
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000  # ms per call
+
+def bench(user_count, seed=0):
+    rng = random.Random(seed)
+    user_data = {str(i): {"points": int(rng.paretovariate(1.2) * 10), "level": 0} for i in range(user_count)}
+    user_ids = list(user_data)
+    probes = [rng.choice(user_ids) for _ in range(100)]
+
+    start = time.perf_counter()
+    index = RankIndex((user_id, record["points"]) for user_id, record in user_data.items())
+    build_ms = (time.perf_counter() - start) * 1000
+
+    def sort_top10():
+        sorted(user_data.items(), key=lambda x: x[1]["points"], reverse=True)[:10]
+
+    def sort_rank():  # What a rank lookup would cost without an index: count everyone ahead
+        points = user_data[probes[0]]["points"]
+        sum(1 for record in user_data.values() if record["points"] > points)
+
+    def award():  # The on_message path: one point for a random active user
+        user_id = rng.choice(probes)
+        user_data[user_id]["points"] += 1
+        index.update(user_id, user_data[user_id]["points"])
+
+    repeat = max(3, 1_000_000 // user_count)
+    return {
+        "users": user_count,
+        "index_build_ms": build_ms,
+        "sort_top10_ms": timed(sort_top10, repeat),
+        "index_top10_ms": timed(lambda: index.top(10), 10_000),
+        "scan_rank_ms": timed(sort_rank, repeat),
+        "index_rank_ms": timed(lambda: [index.rank(user_id) for user_id in probes], 100) / len(probes),
+        "index_update_ms": timed(award, 10_000),
+    }
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    columns = ["users", "index_build_ms", "sort_top10_ms", "index_top10_ms", "scan_rank_ms", "index_rank_ms", "index_update_ms"]
+    print(" ".join(f"{column:>16}" for column in columns))
+    for count in counts:
+        result = bench(count)
+        print(" ".join(f"{result[column]:>16.4f}" if column != "users" else f"{result[column]:>16}" for column in columns))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Memory and startup cost of the member/message cache profiles (TURBO_CACHE_PROFILE), without network.
+
+Feeds synthetic gateway payloads into a real discord.py connection state built with the options
+of each profile: a GUILD_CREATE, the GUILD_MEMBERS_CHUNK pages that chunking would bring (only
+where the profile chunks the guild), a stream of MESSAGE_CREATE and GUILD_MEMBER_ADD events.
+Reports the memory the caches retain (tracemalloc), the CPU time spent on GUILD_CREATE and the
+member chunks (for the lean profile, chunked lazily after startup) and the number of chunk pages.
+Gateway round trips are not included, so real startups are slower than the CPU time shown.
+Results are printed and written as JSON.
+
+Usage:
+    python benchmarks/bench_memory.py                        # default scales, writes bench_memory_results.json
+    python benchmarks/bench_memory.py --quick                # small scales, for a smoke run
+    python benchmarks/bench_memory.py --members 1000 500000 --messages 5000 --output results.json
+"""
+import argparse
+import gc
+import itertools
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discord  # noqa: E402
+from discord.state import ChunkRequest  # noqa: E402
+import turbo  # noqa: E402
+
+GUILD_ID = 1
+CHANNEL_ID = 2
+BOT_ID = 3
+CHUNK_SIZE = 1000  # Members per GUILD_MEMBERS_CHUNK page, as sent by Discord
+JOINED_AT = "2024-01-01T00:00:00+00:00"
+MAX_MESSAGES = {"default": 1000, "lean": 100}  # Each profile's TURBO_MAX_MESSAGES default
+
+def user_payload(user_id):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": None, "avatar": None}
+
+def member_payload(user_id):
+    return {"user": user_payload(user_id), "roles": [], "joined_at": JOINED_AT, "deaf": False, "mute": False, "flags": 0}
+
+def guild_payload(member_count):
+    # Like Discord, GUILD_CREATE of a large guild only carries the bot's own member
+    return {
+        "id": str(GUILD_ID), "name": "bench", "owner_id": str(BOT_ID), "member_count": member_count, "large": member_count > 250,
+        "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False}],
+        "channels": [{"id": str(CHANNEL_ID), "type": 0, "name": "general", "position": 0, "permission_overwrites": []}],
+        "members": [member_payload(BOT_ID)], "emojis": [], "stickers": [], "features": [], "threads": [],
+    }
+
+def message_payload(message_id, user_id):
+    return {
+        "id": str(message_id), "channel_id": str(CHANNEL_ID), "guild_id": str(GUILD_ID), "author": user_payload(user_id),
+        "member": {key: value for key, value in member_payload(user_id).items() if key != "user"},
+        "content": "some ordinary chat message of a reasonable length", "timestamp": JOINED_AT, "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+        "pinned": False, "type": 0,
+    }
+
+def make_state(profile):
+    options = turbo.cache_options(profile, turbo.intents, MAX_MESSAGES[profile])
+    client = discord.Client(intents=turbo.intents, **options)
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=user_payload(BOT_ID))
+    return client, state
+
+def chunks_guild(profile, member_count, chunk_limit):
+    if profile == "default":
+        return True
+    return member_count <= chunk_limit  # member_chunker's rule (a limit of 0 chunks nothing)
+
+def simulate(profile, member_count, message_count, join_count, chunk_limit):
+    """Play the startup and some traffic through a fresh state; return (client, CPU seconds of the startup, chunk pages)."""
+    client, state = make_state(profile)
+    elapsed = 0.0
+    start = time.perf_counter()
+    state._add_guild_from_data(guild_payload(member_count))
+    elapsed += time.perf_counter() - start
+
+    # The default profile chunks every guild at startup; the lean one only small guilds, later
+    chunks = 0
+    if chunks_guild(profile, member_count, chunk_limit):
+        request = ChunkRequest(GUILD_ID, 0, None, state._get_guild, cache=True)
+        state._chunk_requests[request.nonce] = request
+        chunks = math.ceil(member_count / CHUNK_SIZE)
+        for index in range(chunks):
+            page = [member_payload(user_id) for user_id in range(10 + index * CHUNK_SIZE, 10 + min((index + 1) * CHUNK_SIZE, member_count))]
+            data = {"guild_id": str(GUILD_ID), "members": page, "chunk_index": index, "chunk_count": chunks, "nonce": request.nonce}
+            start = time.perf_counter()
+            state.parse_guild_members_chunk(data)
+            elapsed += time.perf_counter() - start
+
+    # Traffic after startup: messages fill the message cache, joins the member cache
+    for message_id in range(message_count):
+        state.parse_message_create(message_payload(10**9 + message_id, 10 + message_id % max(member_count, 1)))
+    for user_id in range(join_count):
+        state.parse_guild_member_add({**member_payload(10**8 + user_id), "guild_id": str(GUILD_ID)})
+    return client, elapsed, chunks
+
+def measure(profile, member_count, args):
+    _, elapsed, chunks = simulate(profile, member_count, args.messages, args.joins, args.chunk_limit)  # Timed without tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    client, _, _ = simulate(profile, member_count, args.messages, args.joins, args.chunk_limit)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    guild = client.get_guild(GUILD_ID)
+    return {
+        "cached_members": len(guild.members),
+        "cached_messages": len(client.cached_messages),
+        "retained_mb": round(retained / 2**20, 2),
+        "startup_cpu_ms": round(elapsed * 1000, 1),
+        "chunk_requests": chunks,
+    }
+
+def run(args):
+    results = []
+    for member_count, profile in itertools.product(args.members, args.profiles):
+        result = measure(profile, member_count, args)
+        results.append({"profile": profile, "members": member_count, **result})
+        print(f"{profile:<8} members={member_count:<9} cached={result['cached_members']:<9} messages={result['cached_messages']:<6}"
+              f" {result['retained_mb']:>9.2f} MB {result['startup_cpu_ms']:>10.1f} ms startup CPU  {result['chunk_requests']:>5} chunks")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, nargs="+", default=[500, 10_000, 100_000])
+    parser.add_argument("--messages", type=int, default=5_000, help="MESSAGE_CREATE events after startup")
+    parser.add_argument("--joins", type=int, default=1_000, help="GUILD_MEMBER_ADD events after startup")
+    parser.add_argument("--profiles", nargs="+", default=["default", "lean"], choices=["default", "lean"])
+    parser.add_argument("--chunk-limit", type=int, default=turbo.CHUNK_LIMIT, help="TURBO_CHUNK_LIMIT of the lean profile")
+    parser.add_argument("--quick", action="store_true", help="small scales for a smoke run")
+    parser.add_argument("--output", default="bench_memory_results.json")
+    args = parser.parse_args()
+    if args.quick:
+        args.members, args.messages, args.joins = [500, 5_000], 1_000, 200
+
+    results = run(args)
+    report = {
+        "benchmark": "memory",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "discord_py": discord.__version__,
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Messages per second of the forbidden-word check, WordMatcher against one substring scan per word.
+Usage: python benchmarks/bench_moderation.py [wordlist sizes...]   (default: 3 100 1000 10000)
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from turbo import WordMatcher  # noqa: E402
+
+MESSAGE_LENGTHS = (40, 200, 1000)
+MESSAGES_PER_RUN = 300
+
+def random_word(rng, low=4, high=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+def make_messages(rng, length, count):
+    """Clean-looking chat text: the worst case for the check, since nothing matches early."""
+    vocabulary = [random_word(rng, 2, 8) for _ in range(500)]
+    messages = []
+    for _ in range(count):
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(rng.choice(vocabulary).capitalize() if rng.random() < 0.1 else rng.choice(vocabulary))
+        messages.append(" ".join(words)[:length])
+    return messages
+
+def rate(check, messages):
+    start = time.perf_counter()
+    for content in messages:
+        check(content)
+    return len(messages) / (time.perf_counter() - start)
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [3, 100, 1000, 10_000]
+    rng = random.Random(0)
+    print(f"{'words':>8} {'length':>8} {'compile_ms':>12} {'substring msg/s':>16} {'matcher msg/s':>16}")
+    for size in sizes:
+        words = {random_word(rng, 6, 12) for _ in range(size)}
+        start = time.perf_counter()
+        matcher = WordMatcher(words)
+        matcher.find("")  # Compile
+        compile_ms = (time.perf_counter() - start) * 1000
+        for length in MESSAGE_LENGTHS:
+            messages = make_messages(rng, length, MESSAGES_PER_RUN)
+            naive = rate(lambda content: any(word in content.lower() for word in words), messages)
+            compiled = rate(matcher.find, messages)
+            print(f"{size:>8} {length:>8} {compile_ms:>12.2f} {naive:>16.0f} {compiled:>16.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,2170 @@
 import discord
 from discord.ext import commands
 import os
+import abc
 from dotenv import load_dotenv
 import aiohttp
+from aiohttp import web
 import random
 import datetime
 import re
 import json
 import html
+import asyncio
+import contextlib
+import tempfile
+import time
+import sqlite3
+import threading
+import collections
+import sys
+import math
+import bisect
+import heapq
+import urllib.parse
+import urllib.request
+import argparse
+import subprocess
+import signal
+import logging
 
 # Load the environment variables from the .env file
 load_dotenv()
 TOKEN = os.getenv("TURBO_TOKEN") # Load environment variables for secure access to sensitive data such as API keys and tokens.
 
+SHARD_COUNT = int(os.getenv("TURBO_SHARD_COUNT", "0")) or None  # Total shards; unset lets Discord recommend a count
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("TURBO_SHARD_IDS", "").split(",") if shard_id.strip()] or None  # Shards run by this process
+SHARDED = os.getenv("TURBO_SHARDED", "0") == "1" or SHARD_IDS is not None  # AutoShardedBot instead of one gateway connection
+PROCESS_COUNT = int(os.getenv("TURBO_PROCESS_COUNT", "1"))  # Bot processes sharing this machine's state (set by `turbo.py launch`)
+STATE_DB = os.getenv("TURBO_STATE_DB", "turbo_state.db")  # State shared by the processes of a multi-process deployment
+if SHARD_IDS is not None and SHARD_COUNT is None:
+    raise ValueError("TURBO_SHARD_IDS needs TURBO_SHARD_COUNT")
+
+def format_shard_ids(shard_ids):
+    """"0-3" for a contiguous range of shard IDs, "0,2,5" otherwise."""
+    if len(shard_ids) > 1 and shard_ids == list(range(shard_ids[0], shard_ids[-1] + 1)):
+        return f"{shard_ids[0]}-{shard_ids[-1]}"
+    return ",".join(map(str, shard_ids))
+
+SHARD_TAG = f"shards {format_shard_ids(SHARD_IDS)}" if SHARD_IDS else None  # Tags this process's logs and metrics
+
+LEVELS_BACKEND = os.getenv("TURBO_LEVELS_BACKEND", "sqlite" if PROCESS_COUNT > 1 else "json")  # "json" (levels.json) or "sqlite" (levels.db)
+LEVELS_FILE = "levels.json"
+LEVELS_DB = os.getenv("TURBO_LEVELS_DB", "levels.db")
+LEVELS_FLUSH_INTERVAL = float(os.getenv("TURBO_LEVELS_FLUSH_INTERVAL", "30"))  # Seconds between background saves
+LEVELS_FLUSH_THRESHOLD = int(os.getenv("TURBO_LEVELS_FLUSH_THRESHOLD", "500"))  # Save early after this many changes
+LEVELS_CACHE_SIZE = 10_000  # Users kept in memory by the SQLite backend
+ROLE_MESSAGES_FILE = os.getenv("TURBO_ROLE_MESSAGES_FILE", "role_messages.json")  # IDs of the reaction-role messages, per guild
+
+CACHE_PROFILE = os.getenv("TURBO_CACHE_PROFILE", "default")  # "default" (discord.py's caches) or "lean" (large guilds)
+CHUNK_LIMIT = int(os.getenv("TURBO_CHUNK_LIMIT", "1000"))  # Lean profile: guilds up to this many members are still chunked, lazily
+MAX_MESSAGES = int(os.getenv("TURBO_MAX_MESSAGES", "100" if CACHE_PROFILE == "lean" else "1000"))  # discord.py's message cache; 0 turns it off
+
+METRICS_ENABLED = os.getenv("TURBO_METRICS_ENABLED", "0") == "1"  # Latency histograms, counters and the /metrics endpoint
+METRICS_PORT = int(os.getenv("TURBO_METRICS_PORT", "9108"))  # Served on 127.0.0.1 only
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics._observe(self.name, self.labels, time.perf_counter() - self.start)
+
+class Metrics:
+    """
+    In-process counters and latency histograms, rendered in the Prometheus text
+    format. When disabled, inc()/observe() return at once and timer() hands out
+    one shared no-op context manager, so instrumented code costs next to nothing.
+    Gauges are callbacks evaluated only when the metrics are rendered.
+    """
+
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    NOOP = contextlib.nullcontext()
+
+    def __init__(self, enabled, const_labels=None):
+        self.enabled = enabled
+        self.const_labels = self._labels(const_labels or {})  # Added to every series, e.g. the process's shards
+        self.started = time.time()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self.gauges = {}  # name -> callback returning a number or a {field: number} dict
+        self.help = {}
+        self._server = None
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            key = (name, self._labels(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if self.enabled:
+            self._observe(name, self._labels(labels), seconds)
+
+    def _observe(self, name, labels, seconds):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = [0] * (len(self.BUCKETS) + 2)
+        histogram[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def timer(self, name, **labels):
+        """Context manager recording the duration of its block in the `name` histogram."""
+        if not self.enabled:
+            return self.NOOP
+        return _Timer(self, name, self._labels(labels))
+
+    def gauge(self, name, callback, help_text=""):
+        self.gauges[name] = callback
+        self.help[name] = help_text
+
+    def _format_labels(self, labels, extra=()):
+        pairs = list(self.const_labels) + list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (f'{key}="{Metrics._escape(value)}"' for key, value in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def render(self):
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + ("+Inf",), histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {cumulative}")
+        for name, callback in sorted(self.gauges.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Gauge {name} failed: {e}")
+                continue
+            if self.help[name]:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for field, number in value.items():
+                    if isinstance(number, (int, float)):
+                        lines.append(f"{name}{self._format_labels([('field', field)])} {number}")
+            else:
+                lines.append(f"{name}{self._format_labels(())} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name):
+        """{labels: (count, avg seconds, approximate p95 seconds)} for one histogram."""
+        result = {}
+        for (histogram_name, labels), histogram in self.histograms.items():
+            if histogram_name != name:
+                continue
+            count = sum(histogram[:-1])
+            if not count:
+                continue
+            seen = 0
+            p95 = float("inf")
+            for bound, bucket in zip(self.BUCKETS, histogram):
+                seen += bucket
+                if seen >= 0.95 * count:
+                    p95 = bound
+                    break
+            result[dict(labels).get("stage") or dict(labels).get("command") or dict(labels).get("upstream") or dict(labels).get("priority") or ""] = (count, histogram[-1] / count, p95)
+        return result
+
+    async def start(self, port=METRICS_PORT):
+        """Serve /metrics on 127.0.0.1 and start measuring event loop lag."""
+        if not self.enabled or self._server is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._server = web.AppRunner(app, access_log=None)
+        await self._server.setup()
+        await web.TCPSite(self._server, "127.0.0.1", port).start()
+        self._lag_task = asyncio.create_task(self._measure_loop_lag())
+        print(f"Metrics served on http://127.0.0.1:{port}/metrics")
+
+    async def _handle(self, request):
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def _measure_loop_lag(self, interval=0.5):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = loop.time() - start - interval  # How late the loop woke us up
+            self.observe("turbo_event_loop_lag_seconds", max(0.0, lag))
+
+    async def close(self):
+        if self._server is not None:
+            self._lag_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._lag_task
+            await self._server.cleanup()
+            self._server = None
+
+metrics = Metrics(METRICS_ENABLED, {"shards": format_shard_ids(SHARD_IDS)} if SHARD_IDS else None)
+
 # Load levels data
-def load_levels_data():
+def load_levels_data(path=LEVELS_FILE):
     try:
-        with open("levels.json", "r") as file: # Load levels.json to track user activity data for the leveling system.
+        with open(path, "r") as file: # Load levels.json to track user activity data for the leveling system.
             return json.load(file)
     except FileNotFoundError:
         return {}
 
-# Save levels data
-def save_levels_data():
-    with open("levels.json", "w") as file:
-        json.dump(user_data, file, indent=4)
+def write_json_atomic(path, data):
+    """Write data to path through a temporary file so a crash never leaves a truncated file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, prefix=f".{os.path.basename(path)}-", suffix=".tmp", delete=False) as file:
+        try:
+            json.dump(data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+
+class LevelsBackend(abc.ABC):
+    """
+    Storage for user points and levels. Changes are buffered in memory and
+    saved from a background task every `interval` seconds, or sooner once
+    `threshold` changes have piled up, and always on shutdown.
+    Records are dicts of the form {"points": int, "level": int}.
+    """
+
+    def __init__(self, interval=LEVELS_FLUSH_INTERVAL, threshold=LEVELS_FLUSH_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.dirty = 0  # Changes since the last successful save
+        self.flush_count = 0
+        self.writes_coalesced = 0  # Changes that did not need a write of their own
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    @abc.abstractmethod
+    async def get(self, user_id):
+        """Return a copy of the user's record, or None if they have no points yet."""
+
+    @abc.abstractmethod
+    async def add_points(self, user_id, amount=1):
+        """Add points to a user, creating them if needed, and return a copy of the updated record."""
+
+    @abc.abstractmethod
+    async def set_level(self, user_id, level):
+        """Store the user's new level."""
+
+    @abc.abstractmethod
+    async def top(self, limit):
+        """Return up to `limit` (user_id, record) pairs, highest points first."""
+
+    @abc.abstractmethod
+    async def rank(self, user_id):
+        """Return (rank, total users) for a user, or None if they have no points yet."""
+
+    @abc.abstractmethod
+    async def _write(self):
+        """Save the buffered changes. Runs under the flush lock."""
+
+    def _restore(self):
+        """Put the changes back after a failed _write so the next flush retries them."""
+
+    def mark_dirty(self):
+        self.dirty += 1
+        if self.dirty >= self.threshold:
+            self._wakeup.set()  # Don't wait for the timer when a lot has changed
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Could not save levels data: {e}")  # Keep the data dirty and retry on the next round
+
+    async def flush(self):
+        async with self._lock:
+            if not self.dirty:
+                return
+            changes, self.dirty = self.dirty, 0
+            start = time.perf_counter()
+            try:
+                await self._write()
+            except BaseException:
+                self._restore()
+                self.dirty += changes
+                raise
+            elapsed = (time.perf_counter() - start) * 1000
+            metrics.observe("turbo_levels_flush_seconds", elapsed / 1000)
+            metrics.inc("turbo_levels_writes_coalesced_total", changes - 1)
+            self.flush_count += 1
+            self.writes_coalesced += changes - 1
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self.total_flush_ms += elapsed
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "backend": type(self).__name__,
+            "flushes": self.flush_count,
+            "writes_coalesced": self.writes_coalesced,
+            "pending_changes": self.dirty,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flush_count, 2) if self.flush_count else 0.0,
+        }
+
+class RankIndex:
+    """
+    In-memory ranking of users by score, kept up to date as points are awarded.
+    Users are grouped into one bucket per score, and the non-empty buckets are
+    linked from the highest score down, so top(k) walks exactly k users.
+    A Fenwick tree counts users per score, so rank() is O(log max_score).
+    The usual +1 update moves a user to the neighbouring bucket in O(log max_score).
+    """
+
+    def __init__(self, scores=()):
+        self._score = {}  # user_id -> score
+        self._buckets = {}  # score -> {user_id: None}, in the order users reached that score
+        self._lower = {}  # score -> next lower non-empty score (None for the lowest)
+        self._higher = {}  # score -> next higher non-empty score (None for the highest)
+        self._highest = None
+        self._lowest = None
+        self._tree = [0] * 1025  # Fenwick tree of users per score, index = score + 1 (size - 1 is a power of two)
+        self.build(scores)
+
+    def __len__(self):
+        return len(self._score)
+
+    def __contains__(self, user_id):
+        return user_id in self._score
+
+    def build(self, scores):
+        """Replace the index with (user_id, score) pairs in O(n log n), much faster than n updates."""
+        self._score = dict(scores)
+        self._buckets = {}
+        for user_id, score in self._score.items():
+            self._buckets.setdefault(score, {})[user_id] = None
+        ordered = sorted(self._buckets)
+        self._lower = dict(zip(ordered, [None] + ordered[:-1]))
+        self._higher = dict(zip(ordered, ordered[1:] + [None]))
+        self._lowest = ordered[0] if ordered else None
+        self._highest = ordered[-1] if ordered else None
+        self._rebuild_tree(ordered[-1] if ordered else 0)
+
+    def _rebuild_tree(self, max_score):
+        size = len(self._tree) - 1
+        while size < max_score + 1:
+            size *= 2
+        tree = [0] * (size + 1)
+        for score, bucket in self._buckets.items():
+            tree[score + 1] = len(bucket)
+        for i in range(1, size + 1):  # Linear-time Fenwick construction
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, score, delta):
+        tree = self._tree
+        if score + 1 >= len(tree):
+            self._rebuild_tree(score)  # Counts are rebuilt from the buckets, which already hold this change
+            return
+        i = score + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _count_upto(self, score):
+        """Number of users with a score <= `score`."""
+        tree = self._tree
+        i = min(score + 1, len(tree) - 1)
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _kth_score(self, k):
+        """Score of the k-th lowest user (1-based)."""
+        tree = self._tree
+        pos = 0
+        mask = len(tree) - 1
+        while mask:
+            nxt = pos + mask
+            if nxt < len(tree) and tree[nxt] < k:
+                pos = nxt
+                k -= tree[nxt]
+            mask >>= 1
+        return pos  # Index pos + 1 holds the k-th user, and index = score + 1
+
+    def _predecessor(self, score):
+        """Highest non-empty score below `score`, or None."""
+        count = self._count_upto(score - 1) if score > 0 else 0
+        return self._kth_score(count) if count else None
+
+    def _link(self, score, lower):
+        higher = self._higher[lower] if lower is not None else self._lowest
+        self._buckets[score] = {}
+        self._lower[score] = lower
+        self._higher[score] = higher
+        if lower is None:
+            self._lowest = score
+        else:
+            self._higher[lower] = score
+        if higher is None:
+            self._highest = score
+        else:
+            self._lower[higher] = score
+
+    def _unlink(self, score):
+        lower = self._lower.pop(score)
+        higher = self._higher.pop(score)
+        del self._buckets[score]
+        if lower is None:
+            self._lowest = higher
+        else:
+            self._higher[lower] = higher
+        if higher is None:
+            self._highest = lower
+        else:
+            self._lower[higher] = lower
+
+    def update(self, user_id, score):
+        """Set a user's score, adding them if they are new."""
+        old = self._score.get(user_id)
+        if old == score:
+            return
+        if score not in self._buckets:
+            # A +1 lands right above the user's current bucket, so no search is needed
+            self._link(score, old if old == score - 1 else self._predecessor(score))
+        self._buckets[score][user_id] = None
+        self._score[user_id] = score
+        self._tree_add(score, 1)
+        if old is not None:
+            self._leave_bucket(user_id, old)
+
+    def remove(self, user_id):
+        self._leave_bucket(user_id, self._score.pop(user_id))
+
+    def _leave_bucket(self, user_id, score):
+        bucket = self._buckets[score]
+        del bucket[user_id]
+        self._tree_add(score, -1)
+        if not bucket:
+            self._unlink(score)
+
+    def top(self, k):
+        """User IDs of the k highest scores, best first. Ties keep the order users reached the score."""
+        result = []
+        score = self._highest
+        while score is not None and len(result) < k:
+            for user_id in self._buckets[score]:
+                result.append(user_id)
+                if len(result) == k:
+                    break
+            score = self._lower[score]
+        return result
+
+    def rank(self, user_id):
+        """1-based rank of a user (users with equal scores share a rank), or None if unknown."""
+        score = self._score.get(user_id)
+        if score is None:
+            return None
+        return len(self._score) - self._count_upto(score) + 1
+
+class JsonLevelsBackend(LevelsBackend):
+    """Keeps every user in one dict and rewrites levels.json atomically in a worker thread."""
+
+    def __init__(self, path=LEVELS_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.data = load_levels_data(path)
+        self.ranks = RankIndex((user_id, record["points"]) for user_id, record in self.data.items())
+
+    async def get(self, user_id):
+        record = self.data.get(user_id)
+        return dict(record) if record else None
+
+    async def add_points(self, user_id, amount=1):
+        record = self.data.setdefault(user_id, {"points": 0, "level": 0})
+        record["points"] += amount
+        self.ranks.update(user_id, record["points"])
+        self.mark_dirty()
+        return dict(record)
+
+    async def set_level(self, user_id, level):
+        self.data[user_id]["level"] = level
+        self.mark_dirty()
+
+    async def top(self, limit):
+        return [(user_id, dict(self.data[user_id])) for user_id in self.ranks.top(limit)]
+
+    async def rank(self, user_id):
+        rank = self.ranks.rank(user_id)
+        return (rank, len(self.ranks)) if rank is not None else None
+
+    async def _write(self):
+        # Copy on the event loop so the writer thread never sees a dict being modified
+        snapshot = {user_id: dict(record) for user_id, record in self.data.items()}
+        await asyncio.to_thread(write_json_atomic, self.path, snapshot)
+
+def connect_levels_db(path=LEVELS_DB):
+    """Open the levels database in WAL mode and create the table and points index if needed."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer and vice versa
+    conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, and much cheaper than FULL
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS levels ("
+        "user_id TEXT PRIMARY KEY, points INTEGER NOT NULL DEFAULT 0, level INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS levels_points ON levels (points DESC)")
+    return conn
+
+class SqliteLevelsBackend(LevelsBackend):
+    """
+    Stores users in a SQLite database. Point increments are kept as deltas and
+    upserted in one transaction per flush; recently active users are cached so
+    the message hot path rarely touches the database. Rankings read the
+    database through the points index and add the unsaved deltas on top, and
+    the number of users is counted in memory, so commands never force a write.
+    """
+
+    UPSERT = (
+        "INSERT INTO levels (user_id, points, level) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET points = points + excluded.points, level = MAX(level, excluded.level)"
+    )
+
+    def __init__(self, path=LEVELS_DB, cache_size=LEVELS_CACHE_SIZE, cache_ttl=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl  # Reload cached users this often when other processes write to the database too
+        self.conn = connect_levels_db(path)
+        self._db_lock = threading.Lock()  # One connection shared by the worker threads
+        self._cache = collections.OrderedDict()  # user_id -> record, least recently used first
+        self._loaded_at = {}  # user_id -> when the cached record was read, only with a cache_ttl
+        self._pending = {}  # user_id -> [points not yet written, highest level set]
+        self._writing = {}  # Batch currently being written, kept for _restore
+        self._unsaved = set()  # Users loaded without a row in the database
+        self._rows = self._query("SELECT COUNT(*) FROM levels")[0][0]  # Users in the database, kept up to date by _write
+        self._counted_at = time.monotonic()
+
+    def _query(self, sql, params=()):
+        with self._db_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _fresh(self, user_id):
+        return self.cache_ttl is None or self._loaded_at[user_id] > time.monotonic() - self.cache_ttl
+
+    async def _load(self, user_id):
+        record = self._cache.get(user_id)
+        if record is not None and self._fresh(user_id):
+            self._cache.move_to_end(user_id)
+            return record
+        rows = await asyncio.to_thread(self._query, "SELECT points, level FROM levels WHERE user_id = ?", (user_id,))
+        record = self._cache.get(user_id)  # Another message may have loaded the user while we waited
+        if record is None or not self._fresh(user_id):
+            points, level = rows[0] if rows else (0, 0)
+            if not rows and not any(user_id in batch for batch in (self._writing, self._pending)):
+                self._unsaved.add(user_id)  # Counted as a user once their first points are written
+            for batch in (self._writing, self._pending):  # Changes the database doesn't have yet
+                if user_id in batch:
+                    points += batch[user_id][0]
+                    level = max(level, batch[user_id][1])
+            record = {"points": points, "level": level}
+            self._cache[user_id] = record
+            self._cache.move_to_end(user_id)
+            if self.cache_ttl is not None:
+                self._loaded_at[user_id] = time.monotonic()
+            if len(self._cache) > self.cache_size:
+                evicted, _ = self._cache.popitem(last=False)
+                self._loaded_at.pop(evicted, None)
+                if evicted not in self._pending and evicted not in self._writing:
+                    self._unsaved.discard(evicted)
+        return record
+
+    async def get(self, user_id):
+        record = await self._load(user_id)
+        return dict(record) if record["points"] else None
+
+    async def add_points(self, user_id, amount=1):
+        record = await self._load(user_id)
+        record["points"] += amount
+        self._pending.setdefault(user_id, [0, 0])[0] += amount
+        self.mark_dirty()
+        return dict(record)
+
+    async def set_level(self, user_id, level):
+        record = await self._load(user_id)
+        record["level"] = level
+        pending = self._pending.setdefault(user_id, [0, 0])
+        pending[1] = max(pending[1], level)
+        self.mark_dirty()
+
+    def _saved_records(self, user_ids):
+        """(points, level) in the database of each of `user_ids` that has a row."""
+        user_ids = list(user_ids)
+        saved = {}
+        for start in range(0, len(user_ids), 500):  # Stay under SQLite's limit on bound parameters
+            batch = user_ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT user_id, points, level FROM levels WHERE user_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            saved.update((user_id, (points, level)) for user_id, points, level in rows)
+        return saved
+
+    def _top_query(self, limit, user_ids):
+        with self._db_lock:
+            rows = self.conn.execute("SELECT user_id, points, level FROM levels ORDER BY points DESC LIMIT ?", (limit,)).fetchall()
+            return rows, self._saved_records(user_ids)
+
+    def _rank_query(self, points, user_ids, recount):
+        with self._db_lock:
+            ahead = self.conn.execute("SELECT COUNT(*) FROM levels WHERE points > ?", (points,)).fetchone()[0]
+            rows = self.conn.execute("SELECT COUNT(*) FROM levels").fetchone()[0] if recount else None
+            return ahead, self._saved_records(user_ids), rows
+
+    def _user_count(self):
+        return self._rows + len(self._unsaved.intersection(self._pending))
+
+    async def top(self, limit):
+        async with self._lock:  # No flush half done: the database and _pending don't overlap
+            pending = {user_id: list(change) for user_id, change in self._pending.items()}
+            rows, saved = await asyncio.to_thread(self._top_query, limit, pending)
+        # The true top `limit` is among the saved top `limit` and the users with unsaved points
+        records = {user_id: [points, level] for user_id, points, level in rows}
+        for user_id, (points, level) in pending.items():
+            saved_points, saved_level = saved.get(user_id, (0, 0))
+            records[user_id] = [saved_points + points, max(saved_level, level)]
+        ranked = heapq.nlargest(limit, records.items(), key=lambda item: item[1][0])
+        return [(user_id, {"points": points, "level": level}) for user_id, (points, level) in ranked]
+
+    async def rank(self, user_id):
+        record = await self.get(user_id)
+        if record is None:
+            return None
+        points = record["points"]
+        # Other processes add users too, so their count is re-read from the database now and then
+        recount = self.cache_ttl is not None and time.monotonic() - self._counted_at > self.cache_ttl
+        async with self._lock:
+            pending = {other: change[0] for other, change in self._pending.items() if other != user_id and change[0]}
+            ahead, saved, rows = await asyncio.to_thread(self._rank_query, points, pending, recount)
+            if rows is not None:
+                self._rows, self._counted_at = rows, time.monotonic()
+        # Move the users whose unsaved points change which side of `points` they are on
+        for other, delta in pending.items():
+            saved_points = saved.get(other, (None,))[0]
+            if saved_points is not None and saved_points > points:
+                ahead -= 1
+            if (saved_points or 0) + delta > points:
+                ahead += 1
+        return ahead + 1, max(self._user_count(), ahead + 1)
+
+    def _write_batch(self, batch):
+        with self._db_lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(self.UPSERT, [(user_id, points, level) for user_id, (points, level) in batch.items()])
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    async def _write(self):
+        self._writing, self._pending = self._pending, {}
+        await asyncio.to_thread(self._write_batch, self._writing)
+        inserted = self._unsaved.intersection(self._writing)
+        self._rows += len(inserted)
+        self._unsaved -= inserted
+        self._writing = {}
+
+    def _restore(self):
+        for user_id, (points, level) in self._writing.items():
+            pending = self._pending.setdefault(user_id, [0, 0])
+            pending[0] += points
+            pending[1] = max(pending[1], level)
+        self._writing = {}
+
+    async def close(self):
+        await super().close()
+        self.conn.close()
+
+def migrate_levels_json(json_path=LEVELS_FILE, db_path=LEVELS_DB):
+    """One-shot copy of levels.json into the SQLite database. Safe to run twice: existing rows keep the higher values."""
+    with open(json_path, "r") as file:
+        data = json.load(file)
+    conn = connect_levels_db(db_path)
+    try:
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO levels (user_id, points, level) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET points = MAX(points, excluded.points), level = MAX(level, excluded.level)",
+                [(user_id, record["points"], record["level"]) for user_id, record in data.items()],
+            )
+    finally:
+        conn.close()
+    return len(data)
+
+def create_levels_backend():
+    if LEVELS_BACKEND == "sqlite":
+        # Other processes add points to the same users, so cached records are re-read after a flush interval
+        return SqliteLevelsBackend(cache_ttl=LEVELS_FLUSH_INTERVAL if PROCESS_COUNT > 1 else None)
+    if LEVELS_BACKEND == "json":
+        if PROCESS_COUNT > 1:
+            raise ValueError("levels.json can't be shared between processes; use TURBO_LEVELS_BACKEND=sqlite")
+        return JsonLevelsBackend()
+    raise ValueError(f"Unknown TURBO_LEVELS_BACKEND: {LEVELS_BACKEND!r} (expected 'json' or 'sqlite')")
 
 # Initialize levels data
-user_data = load_levels_data()
+levels_store = create_levels_backend()
 
 def calculate_level(points):
     """Calculate the user's level based on their points."""
     return int(points ** 0.5)  # Level increases with square root of points
 
+class SharedState(abc.ABC):
+    """
+    Key-value state that every bot process has to agree on once the shards
+    are spread over several processes: saved role message IDs, cached API
+    answers and the pacing of rate-limited APIs. Values must be JSON
+    serializable. MemorySharedState is for a single process; SqliteSharedState
+    keeps the state in a WAL database that all the processes open.
+    """
+
+    @abc.abstractmethod
+    async def get(self, namespace, key):
+        """Return the stored value, or None if there is none or it has expired."""
+
+    @abc.abstractmethod
+    async def set(self, namespace, key, value, ttl=None):
+        """Store a value, expiring after `ttl` seconds if given."""
+
+    @abc.abstractmethod
+    async def reserve(self, lane, interval):
+        """Take the next free slot of a lane allowing one call every `interval` seconds; return how long to wait for it."""
+
+    def close(self):
+        pass
+
+class MemorySharedState(SharedState):
+    def __init__(self, maxsize=10_000):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()  # (namespace, key) -> (expires_at or None, value), least recently used first
+        self._slots = {}  # lane -> time its next slot is free
+
+    async def get(self, namespace, key):
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[(namespace, key)]
+            return None
+        self._data.move_to_end((namespace, key))
+        return value
+
+    async def set(self, namespace, key, value, ttl=None):
+        self._data[(namespace, key)] = (time.time() + ttl if ttl else None, value)
+        self._data.move_to_end((namespace, key))
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def reserve(self, lane, interval):
+        now = time.time()
+        slot = max(now, self._slots.get(lane, 0.0))
+        self._slots[lane] = slot + interval
+        return slot - now
+
+class SqliteSharedState(SharedState):
+    UPSERT = (
+        "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+    )
+
+    def __init__(self, path=STATE_DB, sweep_interval=60.0):
+        self.path = path
+        self.sweep_interval = sweep_interval  # Seconds between deletions of expired rows
+        self._next_sweep = 0.0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")  # Other processes hold the write lock only for a moment
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS state_expires_at ON state (expires_at)")
+        self._db_lock = threading.Lock()
+
+    def _get(self, namespace, key):
+        with self._db_lock:
+            row = self.conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, str(key), time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, namespace, key, value, ttl):
+        now = time.time()
+        with self._db_lock:
+            self.conn.execute(self.UPSERT, (namespace, str(key), json.dumps(value), now + ttl if ttl else None))
+            if now >= self._next_sweep:  # Expired rows are only skipped by reads; drop them now and then
+                self._next_sweep = now + self.sweep_interval
+                self.conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+
+    def _reserve(self, lane, interval):
+        with self._db_lock:
+            self.conn.execute("BEGIN IMMEDIATE")  # Read and bump the slot without another process in between
+            try:
+                row = self.conn.execute("SELECT value FROM state WHERE namespace = 'lanes' AND key = ?", (lane,)).fetchone()
+                now = time.time()
+                slot = max(now, json.loads(row[0]) if row else 0.0)
+                self.conn.execute(self.UPSERT, ("lanes", lane, json.dumps(slot + interval), None))
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+        return slot - now
+
+    async def get(self, namespace, key):
+        return await asyncio.to_thread(self._get, namespace, key)
+
+    async def set(self, namespace, key, value, ttl=None):
+        await asyncio.to_thread(self._set, namespace, key, value, ttl)
+
+    async def reserve(self, lane, interval):
+        return await asyncio.to_thread(self._reserve, lane, interval)
+
+    def close(self):
+        self.conn.close()
+
+shared_state = SqliteSharedState() if PROCESS_COUNT > 1 else MemorySharedState()
+
+# Errors an outbound HTTP call can end with once its retries are used up
+HTTP_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+class HttpClient:
+    """
+    One aiohttp session shared by every command for the bot's whole lifetime.
+    The connector keeps connections alive, caches DNS answers and caps
+    connections per host. Requests have timeouts and are retried with
+    exponential backoff on connection errors, timeouts, 429 and 5xx.
+    Latency and error counters are kept per upstream host.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, limit=100, limit_per_host=10, dns_ttl=300, keepalive=30,
+                 timeout=aiohttp.ClientTimeout(total=10, connect=3), retries=2, backoff=0.5):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+        self.upstreams = {}  # host -> counters
+
+    async def start(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive,
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _record(self, host, elapsed_ms, error=False, retry=False):
+        metrics.observe("turbo_http_request_seconds", elapsed_ms / 1000, upstream=host)
+        if error:
+            metrics.inc("turbo_http_errors_total", upstream=host)
+        counters = self.upstreams.setdefault(
+            host, {"requests": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        counters["requests"] += 1
+        counters["errors"] += error
+        counters["retries"] += retry
+        counters["total_ms"] += elapsed_ms
+        counters["max_ms"] = max(counters["max_ms"], elapsed_ms)
+
+    async def get_json(self, url, *, params=None, headers=None):
+        """
+        GET a URL and return (status, data). data is the decoded JSON body for a
+        200 response and None otherwise. Raises one of HTTP_ERRORS if every
+        attempt failed without a response.
+        """
+        await self.start()
+        host = urllib.parse.urlsplit(url).hostname
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            start = time.perf_counter()
+            try:
+                async with self.session.get(url, params=params, headers=headers) as response:
+                    status = response.status
+                    data = await response.json(content_type=None) if status == 200 else None
+                    retry_after = response.headers.get("Retry-After")
+            except HTTP_ERRORS:
+                self._record(host, (time.perf_counter() - start) * 1000, error=True, retry=not last_attempt)
+                if last_attempt:
+                    raise
+                retry_after = None
+            else:
+                retry = status in self.RETRY_STATUSES and not last_attempt
+                self._record(host, (time.perf_counter() - start) * 1000, error=status >= 400, retry=retry)
+                if not retry:
+                    return status, data
+            delay = self.backoff * 2 ** attempt
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(int(retry_after), 10))  # Honour short Retry-After hints
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            host: {
+                "requests": counters["requests"],
+                "errors": counters["errors"],
+                "retries": counters["retries"],
+                "avg_ms": round(counters["total_ms"] / counters["requests"], 1),
+                "max_ms": round(counters["max_ms"], 1),
+            }
+            for host, counters in self.upstreams.items()
+        }
+
+http_client = HttpClient()
+
+class PrefetchPool:
+    """
+    Bounded buffer of items fetched ahead of time by a background task.
+    take() answers from memory; once the buffer drops to `low_water` items a
+    refill task tops it back up to `capacity` in batches. `fetch_batch(n)` is a
+    coroutine returning up to n new items, or an empty list when the upstream
+    has nothing (more) to give. After a failed or empty refill, no new refill
+    starts for `retry_delay` seconds, so a dead upstream isn't hammered.
+    With a `key` function, items already buffered or among the last `recent`
+    served are skipped.
+    """
+
+    def __init__(self, fetch_batch, capacity, low_water, key=None, recent=0, retry_delay=30, max_batches=5):
+        self.fetch_batch = fetch_batch
+        self.capacity = capacity
+        self.low_water = low_water
+        self.key = key
+        self.retry_delay = retry_delay
+        self.max_batches = max_batches  # Per refill, in case batches keep coming back as duplicates
+        self.items = collections.deque()
+        self.refills = 0
+        self.failures = 0
+        self.duplicates = 0
+        self._buffered = set()  # Keys of the buffered items
+        self._recent = collections.deque(maxlen=recent)  # Keys of the last items served
+        self._recent_keys = set()
+        self._retry_at = 0.0
+        self._task = None
+        self._discarded = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def refill(self):
+        """Start a background refill unless one is running or the upstream recently failed. Returns the task or None."""
+        if self._task is None or self._task.done():
+            if time.monotonic() < self._retry_at or self._discarded:
+                return None
+            self._task = asyncio.create_task(self._refill())
+        return self._task
+
+    def _add(self, item):
+        if self.key is not None:
+            key = self.key(item)
+            if key in self._buffered or key in self._recent_keys:
+                self.duplicates += 1
+                return
+            self._buffered.add(key)
+        self.items.append(item)
+
+    async def _refill(self):
+        self.refills += 1
+        for _ in range(self.max_batches):
+            if len(self.items) >= self.capacity:
+                return
+            try:
+                batch = await self.fetch_batch(self.capacity - len(self.items))
+            except Exception as e:
+                self.failures += 1
+                print(f"Prefetch failed: {e}")
+                batch = None
+            if not batch:
+                self._retry_at = time.monotonic() + self.retry_delay
+                return
+            for item in batch:
+                if len(self.items) < self.capacity:
+                    self._add(item)
+
+    def _served(self, item):
+        if self.key is not None:
+            key = self.key(item)
+            self._buffered.discard(key)
+            if self._recent.maxlen:
+                if len(self._recent) == self._recent.maxlen:
+                    self._recent_keys.discard(self._recent[0])
+                self._recent.append(key)
+                self._recent_keys.add(key)
+        return item
+
+    def take(self, count=1):
+        """Pop up to `count` items without waiting, refilling in the background when running low."""
+        items = [self._served(self.items.popleft()) for _ in range(min(count, len(self.items)))]
+        if len(self.items) <= self.low_water:
+            self.refill()
+        return items
+
+    async def take_or_wait(self, count=1):
+        """Like take(), but waits for the refill when the pool is empty (only on a cold start or after an outage)."""
+        if not self.items:
+            task = self.refill()
+            if task is not None:
+                await asyncio.wait({task})  # Doesn't cancel the refill, nor raise if discard() cancelled it
+        return self.take(count)
+
+    def discard(self):
+        """Drop the buffered items and stop any refill, for a pool that is no longer used."""
+        self._discarded = True
+        if self._task is not None:
+            self._task.cancel()
+        self.items.clear()
+        self._buffered.clear()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+class OutboundDropped(Exception):
+    """Raised to the caller of a Discord request that the outbound scheduler dropped under backpressure."""
+
+class _OutboundJob:
+    __slots__ = ("priority", "seq", "bucket", "func", "future", "queued_at", "queued")
+
+    def __init__(self, priority, seq, bucket, func, future):
+        self.priority = priority
+        self.seq = seq
+        self.bucket = bucket
+        self.func = func
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.queued = True
+
+class OutboundScheduler:
+    """
+    Single gate for the REST calls that write to Discord. Requests are queued
+    per rate-limit bucket (e.g. ("channel", id) for sends, ("member", guild_id)
+    for member edits) and released at most `rate` per second overall, the most
+    urgent class first: enforcement (deletions, bans), moderation logs, replies
+    to users, then notifications. Each bucket has one request in flight at a
+    time, so a rate-limited bucket only holds up its own queue. A class over
+    its limit in `limits` drops its oldest queued request, whose caller gets
+    OutboundDropped; enforcement and moderation logs are never dropped. The
+    level-up and moderation log workers merge what piles up behind them while
+    they wait, so a backlog turns into fewer, larger posts.
+    Before start() and after close(), requests run directly.
+    """
+
+    ENFORCEMENT, MODLOG, REPLY, NOTIFICATION = range(4)
+    CLASSES = ("enforcement", "modlog", "reply", "notification")
+
+    def __init__(self, rate=40, burst=10, limits=None):
+        self.rate = rate  # Discord allows 50 requests per second per bot
+        self.burst = burst
+        self.limits = {self.NOTIFICATION: 200} if limits is None else limits  # class -> max queued requests
+        self.sent = 0
+        self.dropped = 0
+        self.max_queued = 0
+        self._queued = [0] * len(self.CLASSES)
+        self._seq = 0
+        self._buckets = {}  # bucket -> heap of (priority, seq, job)
+        self._busy = set()  # Buckets with a request in flight
+        self._ready = []  # Heap of (priority, seq, bucket) for idle buckets with queued requests
+        self._oldest = {priority: collections.deque() for priority in self.limits}  # Queued jobs per limited class, oldest first
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._in_flight = set()  # _execute tasks; the event loop only keeps weak references to them
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, timeout=5.0):
+        """Give queued requests `timeout` seconds to go out, then drop the rest."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (sum(self._queued) or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        if self._in_flight:
+            _, late = await asyncio.wait(set(self._in_flight), timeout=max(0.0, deadline - time.monotonic()))
+            for task in late:
+                task.cancel()
+            await asyncio.gather(*late, return_exceptions=True)
+        for heap in self._buckets.values():
+            for _, _, job in heap:
+                if job.queued and not job.future.done():
+                    job.future.set_exception(OutboundDropped("scheduler closed"))
+        self._buckets.clear()
+        self._ready.clear()
+
+    async def run(self, bucket, priority, func):
+        """Queue `func` (a coroutine function making one request) and return its result once it has run."""
+        if self._task is None:
+            return await func()
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        job = _OutboundJob(priority, self._seq, bucket, func, future)
+        limit = self.limits.get(priority)
+        if limit is not None:
+            oldest = self._oldest[priority]
+            while oldest and not oldest[0].queued:
+                oldest.popleft()  # Already sent or dropped
+            if self._queued[priority] >= limit:
+                self._drop(oldest.popleft())
+            oldest.append(job)
+        heapq.heappush(self._buckets.setdefault(bucket, []), (priority, job.seq, job))
+        self._queued[priority] += 1
+        self.max_queued = max(self.max_queued, sum(self._queued))
+        if bucket not in self._busy:
+            heapq.heappush(self._ready, (priority, job.seq, bucket))
+            self._wakeup.set()
+        return await future
+
+    def _drop(self, job):
+        job.queued = False
+        self._queued[job.priority] -= 1
+        self.dropped += 1
+        metrics.inc("turbo_outbound_dropped_total", priority=self.CLASSES[job.priority])
+        if not job.future.done():
+            job.future.set_exception(OutboundDropped(f"{self.CLASSES[job.priority]} queue is full"))
+
+    def _head(self, bucket):
+        """The bucket's next live job, discarding dropped and cancelled ones."""
+        heap = self._buckets.get(bucket)
+        while heap:
+            job = heap[0][2]
+            if job.queued and not job.future.done():
+                return job
+            heapq.heappop(heap)
+            if job.queued:  # Its caller gave up waiting
+                job.queued = False
+                self._queued[job.priority] -= 1
+        self._buckets.pop(bucket, None)
+        return None
+
+    def _next_job(self):
+        while self._ready:
+            _, seq, bucket = heapq.heappop(self._ready)
+            if bucket in self._busy:
+                continue
+            job = self._head(bucket)
+            if job is None:
+                continue
+            if job.seq != seq:  # Stale entry; make sure the real head is listed
+                heapq.heappush(self._ready, (job.priority, job.seq, bucket))
+                continue
+            heapq.heappop(self._buckets[bucket])
+            job.queued = False
+            self._queued[job.priority] -= 1
+            return job
+        return None
+
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue  # Pick again: something more urgent may have arrived meanwhile
+            job = self._next_job()
+            if job is None:
+                continue
+            self._tokens -= 1
+            self._busy.add(job.bucket)
+            task = asyncio.create_task(self._execute(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, job):
+        metrics.observe("turbo_outbound_wait_seconds", time.monotonic() - job.queued_at, priority=self.CLASSES[job.priority])
+        try:
+            result = await job.func()
+        except asyncio.CancelledError:
+            if not job.future.done():
+                job.future.set_exception(OutboundDropped("scheduler closed"))  # Still running when close() gave up
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.sent += 1
+            self._busy.discard(job.bucket)
+            head = self._head(job.bucket)
+            if head is not None:
+                heapq.heappush(self._ready, (head.priority, head.seq, job.bucket))
+                self._wakeup.set()
+
+    def stats(self):
+        return {
+            "queued": sum(self._queued),
+            "max_queued": self.max_queued,
+            "in_flight": len(self._busy),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+outbound = OutboundScheduler(rate=40 / PROCESS_COUNT, burst=max(1, 10 // PROCESS_COUNT))  # The global rate limit is per bot, not per process
+
+class TurboContext(commands.Context):
+    async def send(self, *args, **kwargs): # Command replies go through the outbound scheduler
+        send = super().send
+        return await outbound.run(("channel", self.channel.id), outbound.REPLY, lambda: send(*args, **kwargs))
+
+async def send_reply(channel, *args, **kwargs):
+    """channel.send() for replies sent outside a command context, through the outbound scheduler."""
+    return await outbound.run(("channel", channel.id), outbound.REPLY, lambda: channel.send(*args, **kwargs))
+
 # Enable intents
 intents = discord.Intents.default()
 intents.message_content = True  # Enable reading message content
 intents.members = True  # Required for member events (join, leave, update)
 intents.guilds = True  # Required for guild-level events (bans, unbans, etc.)
+intents.moderation = True  # Required for on_audit_log_entry_create (moderation logs)
+
+class TurboBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    async def setup_hook(self): # Runs once before connecting: start background workers here.
+        await metrics.start()
+        outbound.start()
+        with contextlib.suppress(NotImplementedError):  # Not available on Windows
+            # Shut down cleanly (and save the levels) on SIGTERM too, e.g. when the launcher stops its workers
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._close_on_signal)
+        levels_store.start()
+        level_up_notifier.start()
+        member_chunker.start()
+        await http_client.start()
+        trivia_pool.warm()  # Default quiz questions are ready before anyone asks
+        joke_buffer.refill()
+        meme_buffer.refill()
+
+    stopping = False  # Set by close(): events are no longer dispatched while the workers drain
+    _close_task = None
+
+    def _close_on_signal(self):
+        if self._close_task is None:
+            self._close_task = asyncio.create_task(self.close())  # Kept here: the loop only holds a weak reference
+
+    async def close(self): # Runs on shutdown: make sure nothing buffered in memory is lost.
+        self.stopping = True
+        try:
+            await join_pipeline.close()
+            await mod_log.close()
+            await level_up_notifier.close()
+            await member_chunker.close()
+            await trivia_pool.close()
+            await joke_buffer.close()
+            await meme_buffer.close()
+            await http_client.close()
+            await outbound.close()  # After the workers above have handed over their last messages
+            await metrics.close()
+            await levels_store.close()  # Last, so points awarded while the rest drained are saved too
+            print(f"Levels data saved: {levels_store.stats()}")
+            shared_state.close()
+        finally:
+            await super().close()
+
+    def dispatch(self, event_name, /, *args, **kwargs):
+        if not self.stopping:
+            super().dispatch(event_name, *args, **kwargs)
+
+    async def get_context(self, origin, /, *, cls=TurboContext):
+        return await super().get_context(origin, cls=cls)
+
+    async def _run_event(self, coro, event_name, *args, **kwargs): # Times every event handler
+        with metrics.timer("turbo_event_seconds", event=event_name):
+            await super()._run_event(coro, event_name, *args, **kwargs)
+
+def cache_options(profile, intents, max_messages):
+    """
+    discord.py cache settings of a profile. "default" caches every member,
+    chunked at startup. "lean" caches no members (the handlers fall back to
+    payload data or fetches) and leaves chunking to `member_chunker`.
+    """
+    if profile == "default":
+        return {"member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+                "chunk_guilds_at_startup": intents.members, "max_messages": max_messages or None}
+    if profile == "lean":
+        return {"member_cache_flags": discord.MemberCacheFlags.none(),
+                "chunk_guilds_at_startup": False, "max_messages": max_messages or None}
+    raise ValueError(f"Unknown TURBO_CACHE_PROFILE: {profile!r} (expected 'default' or 'lean')")
 
 # Create the bot with the intents
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None) # # Initialize the bot with the "!" prefix for commands. Custom help command will be implemented later, so set to None.
+shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARDED else {}
+bot = TurboBot(command_prefix="!", intents=intents, help_command=None, **shard_options,
+               **cache_options(CACHE_PROFILE, intents, MAX_MESSAGES)) # # Initialize the bot with the "!" prefix for commands. Custom help command will be implemented later, so set to None.
+
+class MemberChunker:
+    """
+    Lazy chunking for the lean cache profile. Nothing is chunked at startup;
+    afterwards, guilds with at most `limit` members are chunked one at a time,
+    `interval` seconds apart, so small guilds still get a full member cache
+    without holding up on_ready. Larger guilds are never chunked. With
+    `limit` 0 (or the default profile, which chunks at startup) it does nothing.
+    """
+
+    def __init__(self, bot, limit, interval=1.0):
+        self.bot = bot
+        self.limit = limit
+        self.interval = interval
+        self.queue = asyncio.Queue()
+        self.chunked = 0
+        self.skipped = 0  # Guilds too large to chunk
+        self.failed = 0
+        self._pending = set()
+        self._task = None
+
+    def schedule(self, guild):
+        if not self.limit or guild.chunked or guild.id in self._pending:
+            return
+        if (guild.member_count or 0) > self.limit:
+            self.skipped += 1
+            return
+        self._pending.add(guild.id)
+        self.queue.put_nowait(guild.id)
+
+    def start(self):
+        if self._task is None and self.limit:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            guild_id = await self.queue.get()
+            self._pending.discard(guild_id)
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild.chunked:
+                continue  # Left the guild, or already chunked
+            try:
+                await guild.chunk()
+                self.chunked += 1
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                self.failed += 1
+                print(f"Could not chunk the members of {guild.name}: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "cached_members": sum(len(guild.members) for guild in self.bot.guilds),
+            "chunked": self.chunked,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "pending": self.queue.qsize(),
+        }
+
+member_chunker = MemberChunker(bot, limit=CHUNK_LIMIT if CACHE_PROFILE == "lean" else 0)
+
+async def get_or_fetch_member(guild, user_id):
+    """The cached member, else fetched from the API (lean profile). None if they are no longer in the guild."""
+    member = guild.get_member(user_id)
+    if member is None:
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+    return member
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire `ttl` seconds after they were stored."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()  # key -> (expires_at, value), least recently used first
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]  # Expired
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers for the same key share its result."""
+
+    def __init__(self):
+        self.coalesced = 0  # Callers that joined a call already in flight
+        self._calls = {}  # key -> task
+
+    async def run(self, key, func):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)  # One impatient caller must not cancel the call for everyone
+
+UNKNOWN_USER_NAME = "[Unknown User]"
+
+class NameResolver:
+    """
+    Turns user IDs into display names for rankings. Looks in the gateway cache
+    first, then in a TTL cache of earlier lookups, and only fetches the
+    remaining IDs over REST, concurrently but at most `concurrency` at a time.
+    """
+
+    def __init__(self, bot, maxsize=5000, ttl=3600, concurrency=4):
+        self.bot = bot
+        self.cache = TTLCache(maxsize, ttl)
+        self.concurrency = concurrency
+        self.fetches = 0
+
+    async def _fetch(self, user_id, semaphore):
+        async with semaphore:
+            self.fetches += 1
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                name = UNKNOWN_USER_NAME  # Deleted accounts stay deleted, so this is cached too
+            except discord.HTTPException as e:
+                print(f"Could not fetch user {user_id}: {e}")
+                return user_id, UNKNOWN_USER_NAME  # Not cached, the next call retries
+            else:
+                name = user.name
+        self.cache.set(user_id, name)
+        return user_id, name
+
+    async def resolve(self, user_ids):
+        """Return a dict mapping each user ID (as int) to a display name."""
+        names = {}
+        missing = []
+        for user_id in map(int, user_ids):
+            user = self.bot.get_user(user_id)
+            if user is not None:
+                names[user_id] = user.name
+                continue
+            name = self.cache.get(user_id)
+            if name is not None:
+                names[user_id] = name
+            elif user_id not in missing:
+                missing.append(user_id)
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            names.update(await asyncio.gather(*(self._fetch(user_id, semaphore) for user_id in missing)))
+        return names
+
+    async def name(self, user_id):
+        return (await self.resolve([user_id]))[int(user_id)]
+
+name_resolver = NameResolver(bot)
+
+# Channels the bot looks up by name on its hot paths
+WELL_KNOWN_CHANNELS = {"📬logs", "📈level", "👋welcome", "⭕roles", "🤔quiz"}
+
+class GuildIndex:
+    """
+    Per-guild name -> ID index for the well-known channels and for roles, so
+    handlers don't scan guild.text_channels / guild.roles on every event.
+    Built lazily the first time a guild is looked up, then kept up to date by
+    the on_guild_channel_* and on_guild_role_* events. Duplicate names resolve
+    to the first one in position order, like discord.utils.get.
+    """
+
+    def __init__(self, channel_names):
+        self.channel_names = set(channel_names)
+        self._channels = {}  # guild_id -> {channel name: channel_id}
+        self._roles = {}  # guild_id -> {role name: role_id}
+
+    def _channel_ids(self, guild):
+        ids = self._channels.get(guild.id)
+        if ids is None:
+            ids = self._channels[guild.id] = {}
+            for channel in guild.text_channels:
+                if channel.name in self.channel_names:
+                    ids.setdefault(channel.name, channel.id)
+        return ids
+
+    def _role_ids(self, guild):
+        ids = self._roles.get(guild.id)
+        if ids is None:
+            ids = self._roles[guild.id] = {}
+            for role in guild.roles:
+                ids.setdefault(role.name, role.id)
+        return ids
+
+    def channel(self, guild, name):
+        if name not in self.channel_names:
+            return discord.utils.get(guild.text_channels, name=name)  # Not indexed
+        channel_id = self._channel_ids(guild).get(name)
+        return guild.get_channel(channel_id) if channel_id else None
+
+    def role(self, guild, name):
+        role_id = self._role_ids(guild).get(name)
+        return guild.get_role(role_id) if role_id else None
+
+    def forget(self, guild_id):
+        self._channels.pop(guild_id, None)
+        self._roles.pop(guild_id, None)
+
+    def channel_added(self, channel):
+        if isinstance(channel, discord.TextChannel) and channel.name in self.channel_names:
+            if channel.guild.id in self._channels:
+                self._channels[channel.guild.id].setdefault(channel.name, channel.id)
+
+    def channel_removed(self, channel):
+        ids = self._channels.get(channel.guild.id)
+        if ids is not None and ids.get(channel.name) == channel.id:
+            replacement = discord.utils.get(channel.guild.text_channels, name=channel.name)  # Another channel with the same name
+            if replacement is not None and replacement.id != channel.id:
+                ids[channel.name] = replacement.id
+            else:
+                del ids[channel.name]
+
+    def channel_renamed(self, before, after):
+        if before.name != after.name:
+            self.channel_removed(before)
+            self.channel_added(after)
+
+    def role_added(self, role):
+        if role.guild.id in self._roles:
+            self._roles[role.guild.id].setdefault(role.name, role.id)
+
+    def role_removed(self, role):
+        ids = self._roles.get(role.guild.id)
+        if ids is not None and ids.get(role.name) == role.id:
+            replacement = discord.utils.get(role.guild.roles, name=role.name)
+            if replacement is not None and replacement.id != role.id:
+                ids[role.name] = replacement.id
+            else:
+                del ids[role.name]
+
+    def role_renamed(self, before, after):
+        if before.name != after.name:
+            self.role_removed(before)
+            self.role_added(after)
+
+guild_index = GuildIndex(WELL_KNOWN_CHANNELS)
+
+class ModLogAggregator:
+    """
+    Batches moderation log lines per guild into embeds posted to #📬logs, so a
+    raid costs a few log messages instead of one per action. A guild's buffer is
+    flushed `window` seconds after its first entry, or as soon as it holds
+    `batch_size` entries. The backlog is capped at `max_backlog` entries; what
+    doesn't fit is only counted and summarised ("+137 more deletions").
+    post() never awaits, so logging can't hold up enforcement.
+    """
+
+    PLURALS = {"deletion": "deletions", "ban": "bans", "unban": "unbans", "timeout": "timeouts", "kick": "kicks", "raid": "raid alerts"}
+
+    def __init__(self, window=2.0, batch_size=15, max_backlog=300):
+        self.window = window
+        self.batch_size = batch_size
+        self.max_backlog = max_backlog
+        self.posted = 0
+        self.messages_sent = 0
+        self.dropped_total = 0
+        self._entries = {}  # guild_id -> deque of lines waiting to be sent
+        self._dropped = {}  # guild_id -> Counter of kinds that didn't fit in the backlog
+        self._full = {}  # guild_id -> Event set when a batch is full
+        self._tasks = {}  # guild_id -> flush task
+        self._closing = False  # Set by close(): send without waiting out the window
+
+    def post(self, guild, kind, text):
+        entries = self._entries.setdefault(guild.id, collections.deque())
+        self.posted += 1
+        if len(entries) >= self.max_backlog:
+            self._dropped.setdefault(guild.id, collections.Counter())[kind] += 1
+            self.dropped_total += 1
+        else:
+            entries.append(text)
+        if len(entries) >= self.batch_size:
+            self._full.setdefault(guild.id, asyncio.Event()).set()
+        if guild.id not in self._tasks:
+            self._tasks[guild.id] = asyncio.create_task(self._run(guild))
+
+    def _summary(self, guild_id):
+        dropped = self._dropped.pop(guild_id, None)
+        if not dropped:
+            return None
+        return ", ".join(f"+{count} more {self.PLURALS.get(kind, kind)}" for kind, count in dropped.most_common())
+
+    async def _run(self, guild):
+        entries = self._entries[guild.id]
+        full = self._full.setdefault(guild.id, asyncio.Event())
+        try:
+            while entries or self._dropped.get(guild.id):
+                if len(entries) < self.batch_size and not self._closing:
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(full.wait(), timeout=self.window)
+                full.clear()
+                await self._send_batch(guild, entries)
+        finally:
+            del self._tasks[guild.id]
+
+    async def _send_batch(self, guild, entries):
+        lines = [entries.popleft() for _ in range(min(self.batch_size, len(entries)))]
+        if not entries:
+            summary = self._summary(guild.id)  # Only once the backlog is drained, so the count is final
+            if summary:
+                lines.append(f"**{summary}**")
+        log_channel = guild_index.channel(guild, "📬logs")
+        if not log_channel or not lines:
+            return
+        embed = discord.Embed(description="\n".join(lines)[:4096], color=discord.Color.red(), timestamp=discord.utils.utcnow())
+        embed.set_footer(text=f"{len(lines)} moderation event(s)")
+        try:
+            await outbound.run(("channel", log_channel.id), outbound.MODLOG, lambda: log_channel.send(embed=embed))
+            self.messages_sent += 1
+        except discord.HTTPException as e:
+            print(f"Could not send moderation log in {guild.name}: {e}")
+
+    async def close(self):
+        """Send what is still buffered, e.g. on shutdown."""
+        self._closing = True
+        for full in self._full.values():
+            full.set()  # Wake the workers waiting out their window
+        # Let the workers finish: cancelling one in the middle of _send_batch would lose the lines it popped
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        for guild_id, entries in self._entries.items():
+            guild = bot.get_guild(guild_id)
+            while guild is not None and (entries or self._dropped.get(guild_id)):
+                await self._send_batch(guild, entries)
+
+    def stats(self):
+        return {
+            "posted": self.posted,
+            "messages_sent": self.messages_sent,
+            "dropped": self.dropped_total,
+            "backlog": sum(map(len, self._entries.values())),
+        }
+
+mod_log = ModLogAggregator()
+
+class DeletionQueue:
+    """
+    Collects messages flagged by moderation per channel for `window` seconds
+    and removes them with the bulk-delete endpoint, up to 100 per call.
+    Messages older than 14 days can't be bulk-deleted, and a lone message
+    doesn't need it; only those go through single deletes.
+    Keeps counters on queue depth and on the time from a message being posted
+    to it being deleted.
+    """
+
+    BULK_LIMIT = 100
+    BULK_MAX_AGE = datetime.timedelta(days=14, minutes=-5)  # With a margin for clock skew
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.deleted = 0
+        self.bulk_calls = 0
+        self.single_calls = 0
+        self.max_depth = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._pending = {}  # channel_id -> {message_id: message}
+        self._tasks = {}  # channel_id -> flush task
+
+    @property
+    def depth(self):
+        return sum(map(len, self._pending.values()))
+
+    def delete(self, message):
+        """Queue a message for deletion. Never awaits; queuing the same message twice is harmless."""
+        self._pending.setdefault(message.channel.id, {})[message.id] = message
+        self.max_depth = max(self.max_depth, self.depth)
+        if message.channel.id not in self._tasks:
+            self._tasks[message.channel.id] = asyncio.create_task(self._run(message.channel))
+
+    async def _run(self, channel):
+        try:
+            await asyncio.sleep(self.window)  # Let the rest of a spam wave arrive
+            while self._pending.get(channel.id):
+                await self._flush(channel)
+        finally:
+            del self._tasks[channel.id]
+            if not self._pending.get(channel.id):
+                self._pending.pop(channel.id, None)
+
+    def _record(self, messages):
+        now = discord.utils.utcnow()
+        for message in messages:
+            latency = (now - (message.edited_at or message.created_at)).total_seconds() * 1000  # Since it was posted or edited
+            self.total_latency_ms += latency
+            self.max_latency_ms = max(self.max_latency_ms, latency)
+        self.deleted += len(messages)
+
+    async def _flush(self, channel):
+        pending = self._pending[channel.id]
+        batch = [pending.pop(message_id) for message_id in list(pending)[:self.BULK_LIMIT]]
+        cutoff = discord.utils.utcnow() - self.BULK_MAX_AGE
+        recent = [message for message in batch if message.created_at > cutoff]
+        singles = [message for message in batch if message.created_at <= cutoff]
+        if len(recent) >= 2:
+            try:
+                await outbound.run(("delete", channel.id), outbound.ENFORCEMENT, lambda: channel.delete_messages(recent))
+                self.bulk_calls += 1
+                self._record(recent)
+            except discord.HTTPException as e:
+                print(f"Bulk delete failed in #{channel}: {e}")
+                singles += recent  # Fall back to deleting them one by one
+        else:
+            singles += recent
+        for message in singles:
+            try:
+                await outbound.run(("delete", channel.id), outbound.ENFORCEMENT, message.delete)
+                self.single_calls += 1
+                self._record([message])
+            except discord.NotFound:
+                pass  # Already gone
+            except discord.HTTPException as e:
+                print(f"Could not delete message {message.id} in #{channel}: {e}")
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "deleted": self.deleted,
+            "bulk_calls": self.bulk_calls,
+            "single_calls": self.single_calls,
+            "avg_latency_ms": round(self.total_latency_ms / self.deleted, 1) if self.deleted else 0.0,
+            "max_latency_ms": round(self.max_latency_ms, 1),
+        }
+
+deletion_queue = DeletionQueue()
+
+class WordMatcher:
+    """
+    Aho-Corasick automaton over a set of words: one pass over a text tells
+    whether any of the words occurs in it, however long the word list is.
+    Words can be added or removed at runtime. Only the trie itself is edited
+    in place: after any change, the next check recomputes the failure links
+    of the whole automaton in one breadth-first pass, whose cost grows with
+    the total length of all the words. Changes made between two checks share
+    that one pass, so batch them with update() where possible.
+    """
+
+    SCAN_LIMIT = 100  # Up to this many words, plain substring checks are faster than the automaton
+
+    def __init__(self, words=()):
+        self.words = set()
+        self._goto = [{}]  # node -> {character: next node}, node 0 is the root
+        self._word = [None]  # node -> word ending exactly at this node
+        self._fail = [0]  # node -> longest proper suffix that is also in the trie
+        self._output = [None]  # node -> a word ending here or at one of its fail-chain suffixes
+        self._stale = False
+        self._dead_words = 0  # Removed words whose nodes are still in the trie
+        self.update(words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word.lower() in self.words
+
+    def add(self, word):
+        """Insert a word into the trie; the next check rebuilds all the failure links."""
+        word = word.lower()
+        if not word or word in self.words:
+            return
+        self.words.add(word)
+        node = 0
+        for char in word:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._word.append(None)
+                self._fail.append(0)
+                self._output.append(None)
+            node = nxt
+        self._word[node] = word
+        self._stale = True
+
+    def discard(self, word):
+        """Unmark a word in the trie, leaving its nodes; the next check rebuilds all the failure links."""
+        word = word.lower()
+        if word not in self.words:
+            return
+        self.words.discard(word)
+        node = 0
+        for char in word:
+            node = self._goto[node][char]
+        self._word[node] = None
+        self._dead_words += 1
+        self._stale = True
+
+    def update(self, words):
+        """Make the matcher use exactly `words`. Only the changed words touch the trie; the failure links are still rebuilt in full once."""
+        words = {word.lower() for word in words if word}
+        for word in self.words - words:
+            self.discard(word)
+        for word in words - self.words:
+            self.add(word)
+
+    def _rebuild(self):
+        words = self.words
+        self.__init__()
+        for word in words:
+            self.add(word)
+
+    def _compile(self):
+        if self._dead_words > len(self.words):
+            self._rebuild()  # Mostly removed words: start from a clean trie
+        goto, fail, output, word = self._goto, self._fail, self._output, self._word
+        output[0] = None
+        queue = collections.deque()
+        for node in goto[0].values():
+            fail[node] = 0
+            output[node] = word[node]
+            queue.append(node)
+        while queue:  # Breadth-first, so every suffix node is done before its extensions
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                output[child] = word[child] or output[fail[child]]
+                queue.append(child)
+        self._stale = False
+
+    def find(self, text):
+        """Return the first word found in text (case-insensitive), or None."""
+        if self._stale:
+            self._compile()
+        text = text.lower()
+        if len(self.words) <= self.SCAN_LIMIT:  # C-level substring scans win for tiny lists
+            return next((word for word in self.words if word in text), None)
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for char in text:
+            nxt = goto[node].get(char)
+            while nxt is None and node:
+                node = fail[node]
+                nxt = goto[node].get(char)
+            if nxt is None:
+                continue  # Back at the root
+            node = nxt
+            if output[node] is not None:
+                return output[node]
+        return None
 
 # Forbidden words list
 FORBIDDEN_WORDS = {"7mar", "kelb", "bghel"}  # Add your forbidden words here
+forbidden_words = WordMatcher(FORBIDDEN_WORDS)  # Use forbidden_words.add()/.discard() to change the list at runtime
 
 # Allowed domains
-ALLOWED_DOMAINS = {"youtube.com", "discord.com"}  # Add domains you want to allow
+ALLOWED_DOMAINS = {"youtube.com", "discord.com"}  # Add domains you want to allow (their subdomains are allowed too)
+
+# Scheme, optional user info, then the host (a bracketed IPv6 address or anything up to the port/path)
+# Parsed like browsers do (WHATWG URL): any run of / or \ after the scheme, "\" ends the host, and the
+# userinfo runs up to the last "@" before the path
+URL_PATTERN = re.compile(r"https?:[/\\]*(?:[^\s/\\?#]*@)?(\[[^\]\s]*\]|[^\s/\\?#:<>\"'`|()@]*)", re.IGNORECASE)
+
+def extract_hosts(text):
+    """Return the host of every http(s) link in the text, lowercased, in one pass ("" if the link has no host)."""
+    return [match.group(1).lower().rstrip(".") for match in URL_PATTERN.finditer(text)]
+
+def is_allowed_host(host, allowed=ALLOWED_DOMAINS):
+    """True if the host is an allowed domain or a subdomain of one: one set lookup per label."""
+    while True:
+        if host in allowed:
+            return True
+        dot = host.find(".")
+        if dot < 0:
+            return False
+        host = host[dot + 1:]
+
+def find_unauthorized_link(text):
+    """Return the first link host that is not allowed, or None if every link is fine. Links without a host are not allowed."""
+    return next((host or "(no host)" for host in extract_hosts(text) if not is_allowed_host(host)), None)
 
 @bot.event
 async def on_ready(): # Triggered when the bot is connected and ready to interact with Discord servers.
     print(f"Logged in as {bot.user.name} - {bot.user.id}") 
+    for guild in bot.guilds:
+        member_chunker.schedule(guild)
+        if not reaction_role_index.loaded(guild.id):  # on_ready also fires after reconnects
+            await reaction_role_index.load(guild)
     print("Ready to go!")
 
+# Gateway connection of each shard (only dispatched in sharded mode)
+@bot.event
+async def on_shard_connect(shard_id):
+    print(f"Shard {shard_id} connected")
+
+@bot.event
+async def on_shard_disconnect(shard_id):
+    print(f"Shard {shard_id} disconnected")
+    metrics.inc("turbo_shard_disconnects_total", shard=shard_id)
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    print(f"Shard {shard_id} resumed")
+
+class JoinPipeline:
+    """
+    Raid handling for on_member_join. Joins are counted per guild over a
+    sliding `window`. At `raid_threshold` joins the guild enters raid mode:
+    welcomes are merged into one digest in #👋welcome every `digest_interval`
+    seconds, and the "Member" role is handed out by a paced worker,
+    `role_interval` apart, instead of one send and one role edit per join.
+    Raid mode ends by itself at a digest where the window holds no more than
+    `calm_threshold` joins.
+    """
+
+    def __init__(self, window=10.0, raid_threshold=10, calm_threshold=3, digest_interval=10.0,
+                 digest_mentions=20, role_interval=0.5):
+        self.window = window
+        self.raid_threshold = raid_threshold
+        self.calm_threshold = calm_threshold
+        self.digest_interval = digest_interval
+        self.digest_mentions = digest_mentions  # Members named in a digest; the rest are counted
+        self.role_interval = role_interval
+        self.raids = 0
+        self.digests_sent = 0
+        self.roles_assigned = 0
+        self._joins = {}  # guild_id -> deque of join times within the window
+        self._raid_joins = {}  # guild_id -> joins since the raid started, for guilds in raid mode
+        self._welcomes = {}  # guild_id -> members waiting for the next digest
+        self._roles = {}  # guild_id -> deque of members waiting for their role
+        self._digest_tasks = {}  # guild_id -> digest task, while in raid mode
+        self._role_tasks = {}  # guild_id -> role worker task
+
+    def _rate(self, guild_id):
+        """Joins in the last `window` seconds."""
+        joins = self._joins.get(guild_id)
+        if joins is None:
+            return 0
+        cutoff = time.monotonic() - self.window
+        while joins and joins[0] <= cutoff:
+            joins.popleft()
+        if not joins:
+            del self._joins[guild_id]
+            return 0
+        return len(joins)
+
+    def joined(self, member):
+        """Count a join. Returns True if raid mode takes care of the member, False to welcome them right away."""
+        guild = member.guild
+        self._joins.setdefault(guild.id, collections.deque()).append(time.monotonic())
+        if guild.id not in self._digest_tasks:
+            rate = self._rate(guild.id)
+            if rate < self.raid_threshold:
+                return False
+            self.raids += 1
+            self._raid_joins[guild.id] = 0
+            self._digest_tasks[guild.id] = asyncio.create_task(self._run_digests(guild))
+            print(f"Raid mode on in {guild.name}: {rate} joins in {self.window:g}s")
+            mod_log.post(guild, "raid", f"🛡️ **RAID MODE**: {rate} joins in {self.window:g}s. Welcomes are batched and roles assigned gradually.")
+        self._raid_joins[guild.id] += 1
+        self._welcomes.setdefault(guild.id, []).append(member)
+        self._roles.setdefault(guild.id, collections.deque()).append(member)
+        if guild.id not in self._role_tasks:
+            self._role_tasks[guild.id] = asyncio.create_task(self._assign_roles(guild))
+        return True
+
+    async def _run_digests(self, guild):
+        try:
+            while True:
+                await asyncio.sleep(self.digest_interval)
+                await self._send_digest(guild)
+                if self._rate(guild.id) <= self.calm_threshold:
+                    while self._welcomes.get(guild.id):  # Joined while the last digest was being sent
+                        await self._send_digest(guild)
+                    break
+        finally:
+            del self._digest_tasks[guild.id]
+            joins = self._raid_joins.pop(guild.id, 0)
+        print(f"Raid mode off in {guild.name}: {joins} members joined during the raid")
+        mod_log.post(guild, "raid", f"✅ **RAID MODE OFF**: {joins} members joined during the raid.")
+
+    async def _send_digest(self, guild):
+        members = self._welcomes.pop(guild.id, [])
+        channel = guild_index.channel(guild, "👋welcome")
+        if not members or not channel:
+            return
+        named = ", ".join(member.mention for member in members[:self.digest_mentions])
+        others = len(members) - self.digest_mentions
+        text = f"Welcome to the server, {named} … and {others} others! We're glad to have you here. 🎉" if others > 0 \
+            else f"Welcome to the server, {named}! We're glad to have you here. 🎉"
+        try:
+            await outbound.run(("channel", channel.id), outbound.NOTIFICATION, lambda: channel.send(text))
+            self.digests_sent += 1
+        except (OutboundDropped, discord.HTTPException) as e:
+            print(f"Could not send the welcome digest in {guild.name}: {e}")
+
+    async def _assign_roles(self, guild):
+        try:
+            queue = self._roles[guild.id]
+            while queue:
+                member = queue.popleft()
+                role = guild_index.role(guild, "Member")
+                if role is None:
+                    print("Role not found!")
+                    queue.clear()
+                    break
+                try:
+                    await outbound.run(("member", guild.id), outbound.REPLY, lambda: member.add_roles(role))
+                    self.roles_assigned += 1
+                except discord.NotFound:
+                    pass  # Left or was banned in the meantime
+                except discord.HTTPException as e:
+                    print(f"Could not assign {role.name} to {member.name}: {e}")
+                await asyncio.sleep(self.role_interval)
+        finally:
+            del self._role_tasks[guild.id]
+            if not self._roles.get(guild.id):
+                self._roles.pop(guild.id, None)
+
+    def forget(self, guild_id):
+        for tasks in (self._digest_tasks, self._role_tasks):
+            task = tasks.get(guild_id)
+            if task is not None:
+                task.cancel()
+        self._joins.pop(guild_id, None)
+        self._welcomes.pop(guild_id, None)
+        self._roles.pop(guild_id, None)
+
+    async def close(self):
+        tasks = list(self._digest_tasks.values()) + list(self._role_tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        for members in list(self._welcomes.values()):  # Welcome whoever was waiting for the next digest
+            await self._send_digest(members[0].guild)
+
+    def stats(self):
+        return {
+            "raiding_guilds": len(self._digest_tasks),
+            "raids": self.raids,
+            "digests": self.digests_sent,
+            "roles_queued": sum(map(len, self._roles.values())),
+            "roles_assigned": self.roles_assigned,
+        }
+
+join_pipeline = JoinPipeline()
+
 @bot.event
 async def on_member_join(member): # Triggered when a new member joins the server.
+    if join_pipeline.joined(member):
+        return  # Join raid: welcomed in the next digest, role assigned by the paced worker
+
     # Sends a welcome message in the "👋welcome" channel and assigns the default "Member" role.
-    channel = discord.utils.get(member.guild.text_channels, name="👋welcome")
+    channel = guild_index.channel(member.guild, "👋welcome")
     if channel:
-        await channel.send(f"Welcome to the server, {member.mention}! We're glad to have you here. 🎉")
+        try:
+            await outbound.run(("channel", channel.id), outbound.NOTIFICATION,
+                               lambda: channel.send(f"Welcome to the server, {member.mention}! We're glad to have you here. 🎉"))
+        except OutboundDropped:
+            pass  # Too many queued notifications (e.g. a join raid); the role still gets assigned
     
     # Assign the "Member" role to the new user
-    role = discord.utils.get(member.guild.roles, name="Member")  # Find the role by name
+    role = guild_index.role(member.guild, "Member")  # Find the role by name
     if role:
-        await member.add_roles(role)
+        await outbound.run(("member", member.guild.id), outbound.REPLY, lambda: member.add_roles(role))
         print(f"Assigned {role.name} role to {member.name}") # Log the assignment of the role.
     else:
         print("Role not found!") # Log if the role is not found.    
@@ -74,245 +2175,529 @@ async def on_message(message):
     """
     Handles message events: processes commands, filters forbidden words and links, and manages quiz answers.
     """
-    global quiz_active, current_question, quiz_scores
-
     # Ignore messages from bots
     if message.author.bot:
         return
 
+    if metrics.enabled:
+        metrics.inc("turbo_messages_total", shard=message.guild.shard_id if message.guild else 0)
+
     # Check for forbidden words
-    if any(word in message.content.lower() for word in FORBIDDEN_WORDS): 
-        await message.delete()
-        log_channel = discord.utils.get(message.guild.text_channels, name="📬logs") 
-        if log_channel:
-            await log_channel.send(
-                f"🚨 A message from {message.author.mention} was deleted for containing forbidden words."
-            )
+    with metrics.timer("turbo_on_message_stage_seconds", stage="moderation"):
+        forbidden = forbidden_words.find(message.content)
+    if forbidden:
+        deletion_queue.delete(message)
+        mod_log.post(message.guild, "deletion", f"🚨 A message from {message.author.mention} was deleted for containing forbidden words.")
+        metrics.inc("turbo_moderation_deletions_total", reason="forbidden_words")
         return  # Stop further processing of the message
 
     # Check for unauthorized links
-    if "http" in message.content.lower():  # Rough check for links
-        if not any(domain in message.content.lower() for domain in ALLOWED_DOMAINS):
-            await message.delete() # Delete the message if it contains unauthorized links
-            log_channel = discord.utils.get(message.guild.text_channels, name="📬logs") 
-            if log_channel:
-                await log_channel.send(
-                    f"🚨 A message from {message.author.mention} was deleted for containing unauthorized links."
-                )
-            return  # Stop further processing of the message
+    with metrics.timer("turbo_on_message_stage_seconds", stage="links"):
+        bad_link = find_unauthorized_link(message.content)
+    if bad_link:
+        deletion_queue.delete(message) # Delete the message if it contains unauthorized links
+        mod_log.post(message.guild, "deletion", f"🚨 A message from {message.author.mention} was deleted for containing unauthorized links.")
+        metrics.inc("turbo_moderation_deletions_total", reason="links")
+        return  # Stop further processing of the message
 
     # Leveling system
     user_id = str(message.author.id)
 
-    # Initialize user data if not present
-    if user_id not in user_data:
-        user_data[user_id] = {"points": 0, "level": 0}
-
-    # Award points for the message
-    user_data[user_id]["points"] += 1
-    current_points = user_data[user_id]["points"]
-    current_level = user_data[user_id]["level"]
+    # Award points for the message (the store creates the user's entry if needed and saves it in the background)
+    with metrics.timer("turbo_on_message_stage_seconds", stage="persistence"):
+        record = await levels_store.add_points(user_id)
 
     # Check for level-up
-    new_level = calculate_level(current_points) # Calculate the new level based on the points
-    if new_level > current_level: # Check if the user has leveled up
-        user_data[user_id]["level"] = new_level # Update the user's level
-        await notify_level_up(message.author, new_level, message.guild) # Notify the user about the level-up
-
-    # Save updated data
-    save_levels_data()
-
-    # Quiz-related message processing
-    if quiz_active and current_question:
-        # Ensure the message is in the quiz channel and not a command
-        if message.channel.name == quiz_channel_name and not message.content.startswith(bot.command_prefix):
-            # Extract the user's answer
-            user_answer = message.content.strip().lower()
-
-            # Match the answer with the correct one
-            if user_answer == current_question["answer"]:
-                # Update the user's score
-                if user_id not in quiz_scores:
-                    quiz_scores[user_id] = 0
-                quiz_scores[user_id] += 1
-
+    with metrics.timer("turbo_on_message_stage_seconds", stage="leveling"):
+        new_level = calculate_level(record["points"]) # Calculate the new level based on the points
+        if new_level > record["level"]: # Check if the user has leveled up
+            await levels_store.set_level(user_id, new_level) # Update the user's level
+            if message.guild is not None:  # Nothing to announce a level-up reached in DMs in
+                level_up_notifier.notify(message.author, new_level, message.guild) # Queue the level-up announcement
+
+    # Quiz-related message processing: only channels with a running quiz get here, in O(1)
+    with metrics.timer("turbo_on_message_stage_seconds", stage="quiz"):
+        session = quiz_manager.get(message.channel)
+        if session and session.current and not message.content.startswith(bot.command_prefix):
+            result = session.answer(user_id, message.content) # Scores and claims the question before any await
+
+            if result is QuizSession.CORRECT:
                 # Notify the user and send the next question
-                await message.channel.send(f"✅ **Correct!** Well done, {message.author.mention}. 🎉 You earned 1 point!")
-                current_question = None
-                await send_next_question(message.channel) # Send the next question
-            elif user_answer.isdigit():
-                # Handle numerical input for multiple-choice questions
-                option_index = int(user_answer) - 1 # Convert the user's answer to an integer
-                if 0 <= option_index < len(current_question["options"]): # Check if the option is valid
-                    selected_option = current_question["options"][option_index] # Get the selected option
-                    if selected_option == current_question["answer"]: # Check if the selected option is correct
-                        # Update the user's score
-                        if user_id not in quiz_scores: # Check if the user is in the quiz scores
-                            quiz_scores[user_id] = 0 # Initialize the user's score
-                        quiz_scores[user_id] += 1 # Increment the user's score
-
-                        # Notify the user and send the next question
-                        await message.channel.send(f"✅ **Correct!** Well done, {message.author.mention}. 🎉 You earned 1 point!")
-                        current_question = None
-                        await send_next_question(message.channel)
-                    else:
-                        await message.channel.send(f"❌ Wrong answer, {message.author.mention}. Try again!") # Notify the user about the incorrect answer
-                else:
-                    await message.channel.send(f"⚠️ Invalid option, {message.author.mention}. Please choose a valid number.") # Notify the user about the invalid option
-            else:
-                # Notify incorrect answers
-                await message.channel.send(f"❌ Wrong answer, {message.author.mention}. Try again!")
+                await send_reply(message.channel, f"✅ **Correct!** Well done, {message.author.mention}. 🎉 You earned 1 point!")
+                await send_next_question(session)
+            elif result is QuizSession.WRONG:
+                await send_reply(message.channel, f"❌ Wrong answer, {message.author.mention}. Try again!") # Notify the user about the incorrect answer
+            elif result is QuizSession.INVALID:
+                await send_reply(message.channel, f"⚠️ Invalid option, {message.author.mention}. Please choose a valid number.") # Notify the user about the invalid option
 
     # Allow other commands to be processed
-    await bot.process_commands(message) 
+    with metrics.timer("turbo_on_message_stage_seconds", stage="process_commands"):
+        await bot.process_commands(message) 
 
-async def notify_level_up(user, new_level, guild):
-    # Notifies the user in both the level-up channel and DMs. If DMs are disabled, logs an error message.
-    level_up_message = f"🎉 {user.mention}, you have leveled up to **Level {new_level}!** 🌟"
-
-    # Notify in the dedicated level-up channel
-    level_up_channel = discord.utils.get(guild.text_channels, name="📈level")
-    if level_up_channel:
-        await level_up_channel.send(level_up_message)
+class LevelUpNotifier:
+    """
+    Level-up announcements are queued by on_message and sent by one background
+    worker, so the message hot path never waits on Discord. The worker waits
+    `merge_window` seconds after the first level-up so a burst from one guild
+    becomes a single post in #📈level, then sends the DMs one at a time,
+    `dm_interval` apart. Users whose DMs are closed are remembered for a while
+    instead of being retried on every level.
+    """
 
-    # Send private message to the user
-    try:
-        await user.send(f"🚀 Congratulations! You've reached **Level {new_level}** in {guild.name}! Keep it up! 🌟")
-    except discord.Forbidden:
-        print(f"Could not send level-up DM to {user.name}. They might have DMs disabled.")
+    def __init__(self, maxsize=1000, merge_window=2.0, dm_interval=1.0):
+        self.queue = asyncio.Queue(maxsize)
+        self.merge_window = merge_window
+        self.dm_interval = dm_interval
+        self.dms_closed = TTLCache(maxsize=50_000, ttl=6 * 3600)  # user_id -> True; users may reopen their DMs later
+        self.sent_posts = 0
+        self.sent_dms = 0
+        self.skipped_dms = 0
+        self.dropped = 0
+        self._task = None
+
+    def notify(self, user, new_level, guild):
+        try:
+            self.queue.put_nowait((user, new_level, guild))
+        except asyncio.QueueFull:
+            self.dropped += 1  # Announcements are cosmetic; never let them back up into on_message
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            await asyncio.sleep(self.merge_window)  # Let the rest of a burst arrive
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._send(batch)
+            except Exception as e:
+                print(f"Level-up notification failed: {e}")
+
+    async def _send(self, batch):
+        guilds = {}  # guild_id -> (guild, {user_id: (user, highest new level)})
+        for user, new_level, guild in batch:
+            users = guilds.setdefault(guild.id, (guild, {}))[1]
+            if user.id not in users or users[user.id][1] < new_level:
+                users[user.id] = (user, new_level)
+
+        for guild, users in guilds.values():
+            try:
+                await self._send_guild(guild, users)
+            except Exception as e:  # One guild's failure must not drop the other guilds' announcements
+                print(f"Level-up notification failed in {guild.name}: {e}")
+
+    async def _send_guild(self, guild, users):
+        # Notify in the dedicated level-up channel, one post for the whole burst
+        level_up_channel = guild_index.channel(guild, "📈level")
+        if level_up_channel:
+            lines = [f"🎉 {user.mention}, you have leveled up to **Level {new_level}!** 🌟" for user, new_level in users.values()]
+            for chunk in chunk_lines(lines, 2000):
+                try:
+                    await outbound.run(("channel", level_up_channel.id), outbound.NOTIFICATION,
+                                       lambda: level_up_channel.send(chunk))
+                    self.sent_posts += 1
+                except OutboundDropped:
+                    self.dropped += 1
+                except discord.HTTPException as e:
+                    print(f"Could not post level-ups in {guild.name}: {e}")
+
+        # Send private messages to the users, paced to stay clear of DM rate limits
+        for user, new_level in users.values():
+            if self.dms_closed.get(user.id):
+                self.skipped_dms += 1
+                continue
+            try:
+                await outbound.run(("dm", user.id), outbound.NOTIFICATION,
+                                   lambda: user.send(f"🚀 Congratulations! You've reached **Level {new_level}** in {guild.name}! Keep it up! 🌟"))
+                self.sent_dms += 1
+            except OutboundDropped:
+                self.dropped += 1
+            except discord.Forbidden:
+                self.dms_closed.set(user.id, True)
+                print(f"Could not send level-up DM to {user.name}. They might have DMs disabled.")
+            except discord.HTTPException as e:
+                print(f"Could not send level-up DM to {user.name}: {e}")
+            await asyncio.sleep(self.dm_interval)
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "posts": self.sent_posts,
+            "dms": self.sent_dms,
+            "dms_skipped": self.skipped_dms,
+            "dms_closed_known": len(self.dms_closed),
+            "dropped": self.dropped,
+        }
+
+def chunk_lines(lines, limit):
+    """Join lines into as few messages as possible without going over Discord's `limit` characters."""
+    chunk = ""
+    for line in lines:
+        if chunk and len(chunk) + 1 + len(line) > limit:
+            yield chunk
+            chunk = ""
+        chunk = f"{chunk}\n{line}" if chunk else line[:limit]
+    if chunk:
+        yield chunk
+
+level_up_notifier = LevelUpNotifier()
 
 # Event to check for forbidden words and links in edited messages
+checked_edits = TTLCache(maxsize=10_000, ttl=3600)  # message_id -> hash of the content last checked after an edit
+
 @bot.event
-async def on_message_edit(before, after):
-    if before.author.bot:
+async def on_raw_message_edit(payload): # Raw, so edits of messages outside the message cache are checked too
+    after = payload.message
+    if after.author.bot:
         return  # Ignore bot messages
+    if after.edited_at is None:
+        return  # Never edited: only the embeds changed, e.g. a link preview was added
+    content_hash = hash(after.content)
+    if payload.cached_message is not None and payload.cached_message.content == after.content \
+            or checked_edits.get(after.id) == content_hash:
+        return  # Embeds changed on an edited message whose text was already checked
+    checked_edits.set(after.id, content_hash)
     
     # Detect forbidden words
-    if any(word in after.content.lower() for word in FORBIDDEN_WORDS):
-        await after.delete()
-        log_channel = discord.utils.get(after.guild.text_channels, name="📬logs")
-        if log_channel:
-            await log_channel.send(
-                f"🚨 A message from {after.author.mention} was deleted for containing forbidden words."
-            )
+    if forbidden_words.find(after.content):
+        deletion_queue.delete(after)
+        mod_log.post(after.guild, "deletion", f"🚨 A message from {after.author.mention} was deleted for containing forbidden words.")
         return  # Stop further processing of the message
     
     # check for forbidden links in edited messages
-    if "http" in after.content.lower():  # Rough check for links
-        if not any(domain in after.content.lower() for domain in ALLOWED_DOMAINS):
-            await after.delete()
-            log_channel = discord.utils.get(after.guild.text_channels, name="📬logs")
-            if log_channel:
-                await log_channel.send(
-                    f"🚨 A message from {after.author.mention} was deleted for containing unauthorized links."
-                )
-            return  # Stop further processing of the message
+    if find_unauthorized_link(after.content):
+        deletion_queue.delete(after)
+        mod_log.post(after.guild, "deletion", f"🚨 A message from {after.author.mention} was deleted for containing unauthorized links.")
+        return  # Stop further processing of the message
     
     await bot.process_commands(after)  # Allow other commands to be processed
 
+class ReactionRoleIndex:
+    """
+    Per-guild (message_id, emoji) -> role ID index for the reaction-role
+    messages, so the reaction handlers do one dict lookup and return at once
+    for reactions on any other message. Role messages come from the IDs saved
+    by !setup_roles; guilds set up before those were saved are scanned once
+    for the bot's embeds in #⭕roles whose titles match a category. Role IDs
+    are resolved through guild_index and rebuilt whenever the guild's roles
+    change.
+    """
+
+    def __init__(self, bot, scan_limit=100):
+        self.bot = bot
+        self.scan_limit = scan_limit  # Messages read from #⭕roles when a guild is loaded
+        self._messages = {}  # guild_id -> {message_id: category}
+        self._entries = {}  # guild_id -> {(message_id, emoji): (role_id, role_name)}
+
+    def loaded(self, guild_id):
+        return guild_id in self._messages
+
+    async def load(self, guild):
+        """Find the guild's role messages and build its index."""
+        found = {message_id: category for category, message_id in (await role_message_store.get(guild.id)).items()}
+        channel = guild_index.channel(guild, "⭕roles")
+        if not found and channel is not None:
+            categories = {spec["title"]: category for category, spec in REACTION_ROLE_EMBEDS.items()}
+            try:
+                async for message in channel.history(limit=self.scan_limit):
+                    if message.author.id == self.bot.user.id and message.embeds:
+                        category = categories.get(message.embeds[0].title)
+                        if category:
+                            found[message.id] = category
+            except discord.HTTPException as e:
+                print(f"Could not scan the roles channel of {guild.name}: {e}")
+        self._messages.setdefault(guild.id, {}).update(found)  # Keep messages registered while scanning
+        self.refresh(guild)
+
+    def register(self, guild, category, message_id):
+        self._messages.setdefault(guild.id, {})[message_id] = category
+        self.refresh(guild)
+
+    def unregister(self, guild, message_id):
+        if self._messages.get(guild.id, {}).pop(message_id, None) is not None:
+            self.refresh(guild)
+
+    def messages(self, guild_id):
+        """Return {category: message_id} for the guild, the newest message of each category."""
+        latest = {}
+        for message_id, category in sorted(self._messages.get(guild_id, {}).items()):
+            latest[category] = message_id
+        return latest
+
+    def refresh(self, guild):
+        """Re-resolve the role IDs of the guild's role messages (after its roles change)."""
+        messages = self._messages.get(guild.id)
+        if messages is None:
+            return  # Not loaded yet, load() builds it
+        entries = {}
+        for message_id, category in messages.items():
+            for emoji, role_name in reaction_roles[category].items():
+                role = guild_index.role(guild, role_name)
+                if role:
+                    entries[(message_id, emoji)] = (role.id, role_name)
+        self._entries[guild.id] = entries
+
+    def lookup(self, guild_id, message_id, emoji):
+        """Return (role_id, role_name) for a reaction, or None if it isn't a reaction role."""
+        entries = self._entries.get(guild_id)
+        if entries is None:
+            return None
+        return entries.get((message_id, emoji))
+
+    def forget(self, guild_id):
+        self._messages.pop(guild_id, None)
+        self._entries.pop(guild_id, None)
+
+reaction_role_index = ReactionRoleIndex(bot)
+
 # Event to assign roles based on reactions
 @bot.event
 async def on_raw_reaction_add(payload):
     """ Triggered when a user reacts to a message.
-        Assigns roles to users based on the emoji used. Uses the `reaction_roles` mapping. """
-    if payload.member.bot:
+        Assigns roles to users based on the emoji used. Uses the `reaction_role_index`. """
+    entry = reaction_role_index.lookup(payload.guild_id, payload.message_id, str(payload.emoji))
+    if entry is None:
+        return  # Not a reaction-role message or emoji
+    if payload.member is None or payload.member.bot:
         return  # Ignore bot reactions
 
-    guild = bot.get_guild(payload.guild_id)
-    role_name = None
-
-    # Check which reaction triggered the event
-    for category, emoji_map in reaction_roles.items():
-        if str(payload.emoji) in emoji_map:
-            role_name = emoji_map[str(payload.emoji)]
-            break
-
-    if role_name:
-        role = discord.utils.get(guild.roles, name=role_name)
-        if role:
-            await payload.member.add_roles(role)
-            print(f"Assigned role '{role_name}' to {payload.member.name}")
+    role_id, role_name = entry
+    await outbound.run(("member", payload.guild_id), outbound.REPLY, lambda: payload.member.add_roles(discord.Object(role_id)))
+    print(f"Assigned role '{role_name}' to {payload.member.name}")
 
 # Event to remove roles based on reactions
 @bot.event
 async def on_raw_reaction_remove(payload):
     """Remove role when a reaction is removed."""
-    guild = bot.get_guild(payload.guild_id)
-    member = guild.get_member(payload.user_id)
+    entry = reaction_role_index.lookup(payload.guild_id, payload.message_id, str(payload.emoji))
+    if entry is None:
+        return  # Not a reaction-role message or emoji
 
+    guild = bot.get_guild(payload.guild_id)
+    member = await get_or_fetch_member(guild, payload.user_id) if guild else None  # Removal payloads carry no member
     if not member or member.bot:
         return  # Ignore bot reactions or invalid member
 
-    role_name = None
+    role_id, role_name = entry
+    await outbound.run(("member", payload.guild_id), outbound.REPLY, lambda: member.remove_roles(discord.Object(role_id)))
+    print(f"Removed role '{role_name}' from {member.name}")
 
-    # Check which reaction triggered the event
-    for category, emoji_map in reaction_roles.items():
-        if str(payload.emoji) in emoji_map:
-            role_name = emoji_map[str(payload.emoji)]
-            break
+# Keep the channel and role index in sync with the guild
+@bot.event
+async def on_guild_channel_create(channel):
+    guild_index.channel_added(channel)
 
-    if role_name:
-        role = discord.utils.get(guild.roles, name=role_name)
-        if role:
-            await member.remove_roles(role)
-            print(f"Removed role '{role_name}' from {member.name}")
+@bot.event
+async def on_guild_channel_delete(channel):
+    guild_index.channel_removed(channel)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    guild_index.channel_renamed(before, after)
+
+@bot.event
+async def on_guild_role_create(role):
+    guild_index.role_added(role)
+    reaction_role_index.refresh(role.guild)
+
+@bot.event
+async def on_guild_role_delete(role):
+    guild_index.role_removed(role)
+    reaction_role_index.refresh(role.guild)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    guild_index.role_renamed(before, after)
+    if before.name != after.name:
+        reaction_role_index.refresh(after.guild)
+
+@bot.event
+async def on_guild_join(guild): # The bot was added to a guild
+    member_chunker.schedule(guild)
+    await reaction_role_index.load(guild)
+
+@bot.event
+async def on_guild_remove(guild): # The bot left or was removed from the guild
+    guild_index.forget(guild.id)
+    reaction_role_index.forget(guild.id)
+    join_pipeline.forget(guild.id)
+
+class AuditLogCorrelator:
+    """
+    Matches gateway member events (ban, unban, leave) with the audit log
+    entries streamed by on_audit_log_entry_create, so the moderation logs need
+    no REST query. Entries are keyed by (guild_id, target_id, action): two
+    bans close together still get their own moderator. Whichever side arrives
+    first waits for the other: entries are kept for `ttl` seconds, and member
+    events wait on a future for a few seconds.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.matched = 0
+        self.unmatched = 0  # Member events whose entry never came
+        self.expired = 0  # Entries no member event claimed
+        self._entries = {}  # key -> deque of (expires_at, entry), oldest first
+        self._expiry = collections.deque()  # (expires_at, key), in arrival order
+        self._waiters = {}  # key -> deque of futures, oldest first
+
+    def add(self, entry):
+        target_id = getattr(entry.target, "id", None)
+        if target_id is None:
+            return
+        key = (entry.guild.id, target_id, entry.action)
+        waiters = self._waiters.get(key)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(entry)
+                return
+        self._prune()
+        expires_at = time.monotonic() + self.ttl
+        self._entries.setdefault(key, collections.deque()).append((expires_at, entry))
+        self._expiry.append((expires_at, key))
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, key = self._expiry.popleft()
+            entries = self._entries.get(key)
+            while entries and entries[0][0] <= now:  # Already gone if a member event took it
+                entries.popleft()
+                self.expired += 1
+            if entries is not None and not entries:
+                del self._entries[key]
+
+    def _take(self, key):
+        entries = self._entries.get(key)
+        if not entries:
+            return None
+        _, entry = entries.popleft()
+        if not entries:
+            del self._entries[key]
+        return entry
+
+    async def wait(self, guild_id, target_id, action, timeout):
+        """Return the audit log entry for this action, waiting up to `timeout` seconds for it, or None."""
+        key = (guild_id, target_id, action)
+        entry = self._take(key)
+        if entry is None:
+            future = asyncio.get_running_loop().create_future()
+            waiters = self._waiters.setdefault(key, collections.deque())
+            waiters.append(future)
+            try:
+                entry = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if future in waiters:
+                    waiters.remove(future)
+                if not waiters and self._waiters.get(key) is waiters:
+                    del self._waiters[key]
+        if entry is None:
+            self.unmatched += 1
+        else:
+            self.matched += 1
+        return entry
+
+    def stats(self):
+        return {"matched": self.matched, "unmatched": self.unmatched, "expired": self.expired,
+                "pending": sum(len(entries) for entries in self._entries.values())}
+
+audit_log = AuditLogCorrelator()
+
+def describe_moderator(entry):
+    if entry.user is not None:
+        return str(entry.user)
+    return f"<@{entry.user_id}>"  # Not cached, a mention still shows the name in the log embed
+
+@bot.event
+async def on_audit_log_entry_create(entry): # Needs the View Audit Log permission
+    if entry.action in (discord.AuditLogAction.ban, discord.AuditLogAction.unban, discord.AuditLogAction.kick):
+        audit_log.add(entry)
+    elif (entry.action == discord.AuditLogAction.member_update and hasattr(entry.after, "timed_out_until")
+          and entry.guild.get_member(entry.target.id) is None):
+        # Uncached members (lean profile) get no on_member_update, so their timeouts are logged from here
+        target = entry.target if isinstance(entry.target, (discord.User, discord.Member)) else f"<@{entry.target.id}>"
+        log_timeout(entry.guild, target, entry.after.timed_out_until)
 
 # Logging Events for Manual Actions
 @bot.event
 async def on_member_ban(guild, user):
     """Logs when a member is banned."""
-    log_channel = discord.utils.get(guild.text_channels, name="📬logs")
+    log_channel = guild_index.channel(guild, "📬logs")
     if log_channel:
-        async for entry in guild.audit_logs(limit=1, action=discord.AuditLogAction.ban):
-            moderator = entry.user
+        entry = await audit_log.wait(guild.id, user.id, discord.AuditLogAction.ban, timeout=5)
+        if entry:
             reason = entry.reason or "No reason provided."
-            await log_channel.send(
-                f"🚨 **BAN**: {user} was banned by {moderator}. Reason: {reason}"
-            )
+            mod_log.post(guild, "ban", f"🚨 **BAN**: {user} was banned by {describe_moderator(entry)}. Reason: {reason}")
+        else:
+            mod_log.post(guild, "ban", f"🚨 **BAN**: {user} was banned (moderator unknown).")
 
 @bot.event
 async def on_member_unban(guild, user):
     """Logs when a member is unbanned."""
-    log_channel = discord.utils.get(guild.text_channels, name="📬logs")
+    log_channel = guild_index.channel(guild, "📬logs")
     if log_channel:
-        async for entry in guild.audit_logs(limit=1, action=discord.AuditLogAction.unban):
-            moderator = entry.user
-            await log_channel.send(
-                f"✅ **UNBAN**: {user} was unbanned by {moderator}."
-            )
+        entry = await audit_log.wait(guild.id, user.id, discord.AuditLogAction.unban, timeout=5)
+        if entry:
+            mod_log.post(guild, "unban", f"✅ **UNBAN**: {user} was unbanned by {describe_moderator(entry)}.")
+        else:
+            mod_log.post(guild, "unban", f"✅ **UNBAN**: {user} was unbanned (moderator unknown).")
 
 @bot.event
 async def on_member_update(before, after):
     """Logs timeouts or other significant updates to a member."""
-    log_channel = discord.utils.get(before.guild.text_channels, name="📬logs")
-    if not log_channel:
-        return
-
     # Check for timeout updates
     if before.timed_out_until != after.timed_out_until:
-        if after.timed_out_until:  # Member was timed out
-            timeout_expiry = after.timed_out_until.strftime("%Y-%m-%d %H:%M:%S UTC")
-            await log_channel.send(
-                f"⏱️ **TIMEOUT**: {after} was timed out until {timeout_expiry}."
-            )
-        else:  # Timeout was removed
-            await log_channel.send(f"✅ **TIMEOUT REMOVED**: {after}'s timeout was lifted.")
+        log_timeout(after.guild, after, after.timed_out_until)
+
+def log_timeout(guild, member, timed_out_until):
+    if guild_index.channel(guild, "📬logs") is None:
+        return
+    if timed_out_until:  # Member was timed out
+        timeout_expiry = timed_out_until.strftime("%Y-%m-%d %H:%M:%S UTC")
+        mod_log.post(guild, "timeout", f"⏱️ **TIMEOUT**: {member} was timed out until {timeout_expiry}.")
+    else:  # Timeout was removed
+        mod_log.post(guild, "timeout", f"✅ **TIMEOUT REMOVED**: {member}'s timeout was lifted.")
 
 @bot.event
-async def on_member_remove(member):
+async def on_raw_member_remove(payload): # Raw, so it also fires for members outside the cache
     """Logs when a member is kicked."""
-    log_channel = discord.utils.get(member.guild.text_channels, name="📬logs")
+    guild = bot.get_guild(payload.guild_id)
+    log_channel = guild_index.channel(guild, "📬logs") if guild else None
     if log_channel:
-        async for entry in member.guild.audit_logs(limit=1, action=discord.AuditLogAction.kick):
-            if entry.target == member and entry.created_at > discord.utils.utcnow() - datetime.timedelta(seconds=10):
-                moderator = entry.user
-                reason = entry.reason or "No reason provided."
-                await log_channel.send(f"🚨 **KICK**: {member} was kicked by {moderator}. Reason: {reason}")
-                break
+        # Most members leave on their own, so no entry comes and this just times out
+        entry = await audit_log.wait(guild.id, payload.user.id, discord.AuditLogAction.kick, timeout=3)
+        if entry:
+            reason = entry.reason or "No reason provided."
+            mod_log.post(guild, "kick", f"🚨 **KICK**: {payload.user} was kicked by {describe_moderator(entry)}. Reason: {reason}")
+
+# Command latency
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_time(ctx): # Runs whether the command succeeded or not
+    metrics.observe("turbo_command_seconds", time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name)
 
 # error handling
 @bot.event
 async def on_command_error(ctx, error):
+    metrics.inc("turbo_command_errors_total", error=type(error).__name__)
+    if isinstance(getattr(error, "original", None), OutboundDropped):
+        return  # Replying would only add to the backlog
     if isinstance(error, commands.MissingPermissions):
         await ctx.send("You don't have the necessary permissions to run this command. 🚫")
     elif isinstance(error, commands.MissingRequiredArgument):
@@ -331,21 +2716,21 @@ async def ban(ctx, member: discord.Member, *, reason=None):
     """ Bans a member from the server. Requires the 'ban_members' permission.
     - `ctx`: The context of the command, including the invoking user and channel.
     - `reason`: Optional reason for the ban, logged for moderation purposes.v"""
-    await member.ban(reason=reason)
+    await outbound.run(("member", ctx.guild.id), outbound.ENFORCEMENT, lambda: member.ban(reason=reason))
     await ctx.send(f"{member.mention} has been banned. 🚫")
 
 @bot.command()
 @commands.has_permissions(kick_members=True)
 async def kick(ctx, member: discord.Member, *, reason=None):
     """Kicks a member"""
-    await member.kick(reason=reason)
+    await outbound.run(("member", ctx.guild.id), outbound.ENFORCEMENT, lambda: member.kick(reason=reason))
     await ctx.send(f"{member.mention} has been kicked. 👢")
 
 @bot.command()
 @commands.has_permissions(ban_members=True)
 async def unban(ctx, user: discord.User, *, reason=None):
     """Unbans a user"""
-    await ctx.guild.unban(user, reason=reason)
+    await outbound.run(("member", ctx.guild.id), outbound.ENFORCEMENT, lambda: ctx.guild.unban(user, reason=reason))
     await ctx.send(f"{user.mention} has been unbanned. ✅")
 
 @bot.command()
@@ -369,7 +2754,8 @@ async def timeout(ctx, member: discord.Member, duration: str, *, reason=None):
 
     # Calculate timeout expiration
     timeout_until = datetime.datetime.now(datetime.timezone.utc) + delta
-    await member.edit(timed_out_until=timeout_until, reason=reason)
+    await outbound.run(("member", ctx.guild.id), outbound.ENFORCEMENT,
+                       lambda: member.edit(timed_out_until=timeout_until, reason=reason))
 
     # Notify the user
     timeout_expiry = timeout_until.strftime("%Y-%m-%d %H:%M:%S UTC")
@@ -379,43 +2765,62 @@ async def timeout(ctx, member: discord.Member, duration: str, *, reason=None):
 async def hello(ctx):
     await ctx.send("Hello! TURBO is online and ready!")
 
+# Jokes and memes are prefetched in batches so the commands answer from memory
+async def fetch_jokes(amount):
+    status, data = await http_client.get_json("https://official-joke-api.appspot.com/random_ten")
+    return data if status == 200 else []
+
+class MemeFetcher:
+    """Pages through the r/memes hot listing, keeping only image posts that are safe to show."""
+
+    URL = "https://www.reddit.com/r/memes/hot.json"
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+    def __init__(self):
+        self.after = None  # Listing cursor, so the next batch continues where the last one stopped
+
+    async def __call__(self, amount):
+        params = {"limit": 50}
+        if self.after:
+            params["after"] = self.after
+        headers = {"User-Agent": "Mozilla/5.0"}  # Reddit requires a user-agent
+        status, data = await http_client.get_json(self.URL, params=params, headers=headers)
+        if status != 200:
+            return []
+        listing = data["data"]
+        self.after = listing.get("after")  # None at the end of the listing: start over from the top
+        return [
+            {"id": post["id"], "title": post["title"], "url": post["url"]}
+            for post in (child["data"] for child in listing["children"])
+            if not post.get("stickied") and not post.get("over_18")
+            and post.get("url", "").lower().endswith(self.IMAGE_EXTENSIONS)
+        ]
+
+joke_buffer = PrefetchPool(fetch_jokes, capacity=30, low_water=10, key=lambda joke: joke["id"], recent=200)
+meme_buffer = PrefetchPool(MemeFetcher(), capacity=50, low_water=15, key=lambda meme: meme["id"], recent=500)
+
 @bot.command()
 async def blague(ctx):
-    """Fetches a random joke from the Official Joke API."""
-    url = "https://official-joke-api.appspot.com/random_joke"
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                joke = f"{data['setup']} - {data['punchline']}"
-                await ctx.send(joke)
-            else:
-                await ctx.send("Désolé, je n'ai pas pu récupérer une blague pour le moment. 😢")
+    """Sends a random joke from the Official Joke API, served from the prefetched buffer."""
+    jokes = await joke_buffer.take_or_wait()
+    if jokes:
+        joke = f"{jokes[0]['setup']} - {jokes[0]['punchline']}"
+        await ctx.send(joke)
+    else:
+        await ctx.send("Désolé, je n'ai pas pu récupérer une blague pour le moment. 😢")
 
 @bot.command()
 async def meme(ctx):
-    """Fetches a random meme from r/memes using Reddit's public JSON API."""
-    url = "https://www.reddit.com/r/memes/random/.json"
-
-    headers = {"User-Agent": "Mozilla/5.0"}  # Reddit requires a user-agent
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            if response.status == 200:
-                data = await response.json()
-                # Parse the Reddit JSON structure
-                post = data[0]["data"]["children"][0]["data"]
-                meme_title = post["title"]
-                meme_url = post["url"]
-                
-                # Send an embedded message
-                embed = discord.Embed(title=meme_title, color=discord.Color.random())
-                embed.set_image(url=meme_url)
-                embed.set_footer(text="Source: r/memes")
-                await ctx.send(embed=embed)
-            else:
-                await ctx.send("Désolé, je n'ai pas pu récupérer un meme pour le moment. 😢")
+    """Sends a random meme from r/memes, served from the prefetched buffer."""
+    memes = await meme_buffer.take_or_wait()
+    if memes:
+        # Send an embedded message
+        embed = discord.Embed(title=memes[0]["title"], color=discord.Color.random())
+        embed.set_image(url=memes[0]["url"])
+        embed.set_footer(text="Source: r/memes")
+        await ctx.send(embed=embed)
+    else:
+        await ctx.send("Désolé, je n'ai pas pu récupérer un meme pour le moment. 😢")
 
 @bot.command()
 async def action(ctx, *, action_type=None):
@@ -440,44 +2845,226 @@ async def action(ctx, *, action_type=None):
         valid_actions = ", ".join(actions.keys())
         await ctx.send(f"🤔 I don't know how to do that. Try one of these: {valid_actions}.")
 
+class PurgeJob:
+    """
+    One !clear run, in the background. Pages through the channel history from
+    the command message back, 100 messages at a time; a page that fails is
+    retried from the last message seen, so nothing is fetched twice. Messages
+    under 14 days old are bulk-deleted 100 at a time. Older ones can't be, and
+    go to a single-delete lane paced `single_interval` apart that runs
+    alongside the paging. Progress is shown by editing one status message at
+    most every `update_interval` seconds. Deletions use the reply class of the
+    outbound scheduler, so a big clear never holds up moderation.
+    """
+
+    PAGE_SIZE = 100
+    PAGE_RETRIES = 3
+
+    def __init__(self, ctx, amount, single_interval=1.0, update_interval=2.0):
+        self.channel = ctx.channel
+        self.command = ctx.message
+        self.amount = amount
+        self.single_interval = single_interval
+        self.update_interval = update_interval
+        self.status = None
+        self.scanned = 0
+        self.deleted = 0
+        self.cancelled = False
+        self.task = None
+        self._singles = asyncio.Queue(maxsize=self.PAGE_SIZE)  # Old messages for the single-delete lane; bounds how far paging runs ahead
+        self._last_update = 0.0
+
+    def progress(self):
+        return f"🧹 Clearing messages… {self.deleted} deleted, {self.scanned}/{self.amount} scanned. Use `!clear cancel` to stop."
+
+    async def run(self):
+        self.status = await send_reply(self.channel, self.progress())
+        self._last_update = time.monotonic()
+        lane = asyncio.create_task(self._delete_singles())
+        try:
+            await self._page_through()
+            await self._singles.join()
+        finally:
+            lane.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await lane
+
+    async def _page_through(self):
+        cursor = self.command
+        recent = []
+        while self.scanned < self.amount:
+            page = await self._fetch_page(cursor, min(self.PAGE_SIZE, self.amount - self.scanned))
+            if not page:
+                break  # Reached the start of the channel
+            self.scanned += len(page)
+            cursor = page[-1]
+            cutoff = discord.utils.utcnow() - DeletionQueue.BULK_MAX_AGE
+            for message in page:
+                if message.created_at > cutoff:
+                    recent.append(message)
+                else:
+                    await self._singles.put(message)
+            while len(recent) >= DeletionQueue.BULK_LIMIT:
+                await self._bulk_delete(recent[:DeletionQueue.BULK_LIMIT])
+                del recent[:DeletionQueue.BULK_LIMIT]
+            await self._update()
+        await self._bulk_delete(recent)
+
+    async def _fetch_page(self, cursor, limit):
+        for attempt in range(self.PAGE_RETRIES):
+            try:
+                return [message async for message in self.channel.history(limit=limit, before=cursor)]
+            except discord.Forbidden:
+                raise
+            except discord.HTTPException as e:
+                if attempt == self.PAGE_RETRIES - 1:
+                    raise
+                print(f"Could not read the history of #{self.channel}, retrying: {e}")
+                await asyncio.sleep(2 ** attempt)
+
+    async def _bulk_delete(self, messages):
+        if len(messages) < 2:
+            for message in messages:
+                await self._singles.put(message)  # The bulk endpoint needs at least two
+            return
+        try:
+            await outbound.run(("delete", self.channel.id), outbound.REPLY, lambda: self.channel.delete_messages(messages))
+            self.deleted += len(messages)
+        except discord.Forbidden:
+            raise
+        except discord.HTTPException as e:
+            print(f"Bulk delete failed in #{self.channel}: {e}")
+            for message in messages:
+                await self._singles.put(message)  # Fall back to deleting them one by one
+
+    async def _delete_singles(self):
+        while True:
+            message = await self._singles.get()
+            try:
+                await outbound.run(("delete", self.channel.id), outbound.REPLY, message.delete)
+                self.deleted += 1
+            except discord.NotFound:
+                pass  # Already gone
+            except discord.HTTPException as e:
+                print(f"Could not delete message {message.id} in #{self.channel}: {e}")
+            finally:
+                self._singles.task_done()
+            await self._update()
+            await asyncio.sleep(self.single_interval)
+
+    async def _update(self):
+        if time.monotonic() - self._last_update < self.update_interval:
+            return
+        self._last_update = time.monotonic()
+        try:
+            await outbound.run(("channel", self.channel.id), outbound.REPLY, lambda: self.status.edit(content=self.progress()))
+        except discord.HTTPException:
+            pass  # Progress is best effort
+
+    async def finish(self, text, delete_after):
+        """Show the outcome, then delete it and the !clear message `delete_after` seconds later, however the clear ended."""
+        try:
+            if self.status is not None:
+                await outbound.run(("channel", self.channel.id), outbound.REPLY,
+                                   lambda: self.status.edit(content=text, delete_after=delete_after))
+            else:
+                await send_reply(self.channel, text, delete_after=delete_after)
+        except discord.HTTPException as e:
+            print(f"Could not report the clear in #{self.channel}: {e}")
+            if self.status is not None:
+                with contextlib.suppress(discord.HTTPException):
+                    await self.status.delete(delay=delete_after)
+        finally:
+            with contextlib.suppress(discord.HTTPException):
+                await self.command.delete(delay=delete_after)
+
+class PurgeManager:
+    """Running !clear jobs by channel ID; one per channel at a time."""
+
+    def __init__(self):
+        self.jobs = {}
+
+    def start(self, ctx, amount):
+        """Start clearing `amount` messages in the channel. Returns None if a clear is already running there."""
+        if ctx.channel.id in self.jobs:
+            return None
+        job = self.jobs[ctx.channel.id] = PurgeJob(ctx, amount)
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def cancel(self, channel):
+        job = self.jobs.get(channel.id)
+        if job is None:
+            return False
+        job.cancelled = True
+        job.task.cancel()
+        return True
+
+    async def _run(self, job):
+        try:
+            await job.run()
+        except asyncio.CancelledError:
+            if not job.cancelled:
+                raise  # Shutting down
+            result = (f"🛑 Clear cancelled after {job.deleted} messages.", 10)  # Left up a bit longer than a success so the partial count can be read
+        except discord.HTTPException as e:
+            print(f"Clear stopped in #{job.channel}: {e}")
+            result = (f"⚠️ Clear stopped after {job.deleted} messages: {e.text or e.status}", 10)
+        except Exception as e:
+            print(f"Clear crashed in #{job.channel}: {e!r}")
+            result = (f"⚠️ Clear stopped after {job.deleted} messages.", 10)
+        else:
+            result = (f"Cleared {job.deleted} messages. 🧹", 5)
+        finally:
+            del self.jobs[job.channel.id]
+        await job.finish(*result)
+
+purge_manager = PurgeManager()
+
 # command to clear messages
 @bot.command()
 @commands.has_permissions(manage_messages=True)
-async def clear(ctx, amount: int):
-    # Deletes the specified number of messages plus the command message itself.
-    await ctx.channel.purge(limit=amount + 1)
-    await ctx.send(f"Cleared {amount} messages. 🧹", delete_after=5)
+async def clear(ctx, amount: str):
+    # Deletes the given number of messages before the command in the background. `!clear cancel` stops it.
+    if amount.lower() == "cancel":
+        if not purge_manager.cancel(ctx.channel):
+            await ctx.send("No clear is running in this channel.")
+        return
+    if not amount.isdigit() or int(amount) < 1:
+        raise commands.BadArgument("The amount must be a positive number.")
+    if purge_manager.start(ctx, int(amount)) is None:
+        await ctx.send("🧹 A clear is already running in this channel. Use `!clear cancel` to stop it.")
 
 # command to display user's points and level
 @bot.command()
 async def mon_niveau(ctx):
     """Display the user's points and level."""
-    user_id = str(ctx.author.id)
-    if user_id not in user_data:
+    record = await levels_store.get(str(ctx.author.id))
+    if record is None:
         await ctx.send(f"{ctx.author.mention}, you have no points yet. Start chatting to earn points! 🌟")
         return
 
-    points = user_data[user_id]["points"]
-    level = user_data[user_id]["level"]
-    await ctx.send(f"{ctx.author.mention}, you currently have **{points} points** and are at **Level {level}!** 🚀")
+    points = record["points"]
+    level = record["level"]
+    rank, total = await levels_store.rank(str(ctx.author.id))
+    await ctx.send(
+        f"{ctx.author.mention}, you currently have **{points} points** and are at **Level {level}!** 🚀 "
+        f"You are ranked **#{rank}** of {total}."
+    )
 
 # command to display the leaderboard
 @bot.command()
 async def leaderboard(ctx):
     """Display the top users by points."""
-    if not user_data:
+    top_users = await levels_store.top(10)  # Top 10 users
+    if not top_users:
         await ctx.send("No data available yet. Start chatting to earn points! 🌟")
         return
 
-    # Sort users by points
-    sorted_users = sorted(user_data.items(), key=lambda x: x[1]["points"], reverse=True)
+    names = await name_resolver.resolve(user_id for user_id, _ in top_users)
     leaderboard_message = "**🏆 Leaderboard 🏆**\n"
-    for i, (user_id, data) in enumerate(sorted_users[:10], start=1):  # Top 10 users
-        try:
-            user = await bot.fetch_user(int(user_id))
-            leaderboard_message += f"{i}. {user.name}: {data['points']} points (Level {data['level']})\n"
-        except discord.NotFound:
-            leaderboard_message += f"{i}. [Unknown User]: {data['points']} points (Level {data['level']})\n"
+    for i, (user_id, data) in enumerate(top_users, start=1):
+        leaderboard_message += f"{i}. {names[int(user_id)]}: {data['points']} points (Level {data['level']})\n"
 
     await ctx.send(leaderboard_message)
 
@@ -535,7 +3122,9 @@ async def help(ctx):
 - `!kick [member] [reason]`: Kicks a member.
 - `!unban [user] [reason]`: Unbans a user.
 - `!timeout [member] [duration] [reason]`: Times out a member for a specified duration.
-- `!clear [amount]`: Clears a specified number of messages.
+- `!clear [amount]`: Clears a specified number of messages. `!clear cancel` stops a running clear.
+- `!http_stats`: Shows latency and error counters for the external APIs (admins only).
+- `!stats`: Shows handler latencies, queues and caches (admins only).
 
 **Reaction Roles:**
 - `!setup_roles`: Sets up reaction role messages in the roles channel.
@@ -594,187 +3183,513 @@ reaction_roles = {
     }
 }
 
+# How each category's role message looks; the title also identifies the message in #⭕roles
+REACTION_ROLE_EMBEDS = {
+    "gender": {"title": "Gender", "color": discord.Color.blurple(), "footer": "React to get your gender role.", "label": str.capitalize},
+    "age": {"title": "Age", "color": discord.Color.green(), "footer": "React to get your age group role.", "label": str},
+    "continent": {"title": "Continent", "color": discord.Color.gold(), "footer": "React to get your continent role.", "label": lambda role: role.replace('_', ' ').capitalize()},
+    "dm_status": {"title": "DM Status", "color": discord.Color.purple(), "footer": "React to set your DM status.", "label": str},
+    "color": {"title": "Color", "color": discord.Color.teal(), "footer": "React to set your display color.", "label": str},
+}
+
+class RoleMessageStore:
+    """Message IDs of each guild's reaction-role messages, saved to `path` so !setup_roles can update them in place."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r") as file:
+                self.data = json.load(file)  # {guild_id (str): {category: message_id}}
+        except FileNotFoundError:
+            self.data = {}
+
+    async def get(self, guild_id):
+        return self.data.get(str(guild_id), {})
+
+    async def save(self, guild_id, messages):
+        self.data[str(guild_id)] = messages
+        await asyncio.to_thread(write_json_atomic, self.path, self.data)
+
+class SharedRoleMessageStore:
+    """RoleMessageStore for multi-process deployments: one file rewritten by several processes would lose updates."""
+
+    def __init__(self, state):
+        self.state = state
+
+    async def get(self, guild_id):
+        return await self.state.get("role_messages", guild_id) or {}
+
+    async def save(self, guild_id, messages):
+        await self.state.set("role_messages", guild_id, messages)
+
+role_message_store = SharedRoleMessageStore(shared_state) if PROCESS_COUNT > 1 else RoleMessageStore(ROLE_MESSAGES_FILE)
+
+def role_embed(category):
+    spec = REACTION_ROLE_EMBEDS[category]
+    embed = discord.Embed(
+        title=spec["title"],
+        description="\n".join(
+            [f"{emoji}: `{spec['label'](role)}`" for emoji, role in reaction_roles[category].items()]
+        ),
+        color=spec["color"]
+    )
+    embed.set_footer(text=spec["footer"])
+    return embed
+
+def same_embed(current, wanted):
+    return (current.title, current.description, current.color, current.footer.text) == \
+        (wanted.title, wanted.description, wanted.color, wanted.footer.text)
+
+async def setup_role_message(channel, category, message_id):
+    """Post one category's role message, or update the existing one, and add its missing reactions."""
+    embed = role_embed(category)
+    changes = collections.Counter()
+    message = None
+    if message_id:
+        try:
+            message = await channel.fetch_message(message_id)
+        except discord.NotFound:
+            pass  # Deleted since, post a new one
+
+    if message is None:
+        message = await outbound.run(("channel", channel.id), outbound.REPLY, lambda: channel.send(embed=embed))
+        changes["posted"] += 1
+        present = set()
+    else:
+        if not message.embeds or not same_embed(message.embeds[0], embed):
+            await outbound.run(("channel", channel.id), outbound.REPLY, lambda: message.edit(embed=embed))
+            changes["updated"] += 1
+        present = {str(reaction.emoji) for reaction in message.reactions if reaction.me}
+
+    for emoji in reaction_roles[category]:  # In order, so the reactions line up with the embed
+        if emoji not in present:
+            await outbound.run(("reaction", channel.id), outbound.REPLY, lambda: message.add_reaction(emoji))
+            changes["reactions"] += 1
+    return message, changes
+
 # Command to set up reaction roles
 @bot.command()
 @commands.has_permissions(manage_roles=True)
 async def setup_roles(ctx):
-    """Set up reaction role messages in the roles channel."""
-    roles_channel = discord.utils.get(ctx.guild.text_channels, name="⭕roles")
+    """Set up reaction role messages in the roles channel. Running it again updates the existing messages."""
+    roles_channel = guild_index.channel(ctx.guild, "⭕roles")
     if not roles_channel:
         await ctx.send("Roles channel not found!")
         return
 
-    # Gender Roles Embed
-    gender_embed = discord.Embed(
-        title="Gender",
-        description="\n".join(
-            [f"{emoji}: `{role.capitalize()}`" for emoji, role in reaction_roles["gender"].items()]
-        ),
-        color=discord.Color.blurple()
-    )
-    gender_embed.set_footer(text="React to get your gender role.")
-    gender_message = await roles_channel.send(embed=gender_embed)
-    for emoji in reaction_roles["gender"]:
-        await gender_message.add_reaction(emoji)
-
-    # Age Roles Embed
-    age_embed = discord.Embed(
-        title="Age",
-        description="\n".join(
-            [f"{emoji}: `{role}`" for emoji, role in reaction_roles["age"].items()]
-        ),
-        color=discord.Color.green()
-    )
-    age_embed.set_footer(text="React to get your age group role.")
-    age_message = await roles_channel.send(embed=age_embed)
-    for emoji in reaction_roles["age"]:
-        await age_message.add_reaction(emoji)
-
-    # Continent Roles Embed
-    continent_embed = discord.Embed(
-        title="Continent",
-        description="\n".join(
-            [f"{emoji}: `{role.replace('_', ' ').capitalize()}`" for emoji, role in reaction_roles["continent"].items()]
-        ),
-        color=discord.Color.gold()
+    known = await role_message_store.get(ctx.guild.id) or reaction_role_index.messages(ctx.guild.id)
+    categories = list(reaction_roles)
+    results = await asyncio.gather(  # The messages are independent, so set them up side by side
+        *(setup_role_message(roles_channel, category, known.get(category)) for category in categories),
+        return_exceptions=True
     )
-    continent_embed.set_footer(text="React to get your continent role.")
-    continent_message = await roles_channel.send(embed=continent_embed)
-    for emoji in reaction_roles["continent"]:
-        await continent_message.add_reaction(emoji)
-
-    # DM Status Roles Embed
-    dm_status_embed = discord.Embed(
-        title="DM Status",
-        description="\n".join(
-            [f"{emoji}: `{role}`" for emoji, role in reaction_roles["dm_status"].items()]
-        ),
-        color=discord.Color.purple()
-    )
-    dm_status_embed.set_footer(text="React to set your DM status.")
-    dm_status_message = await roles_channel.send(embed=dm_status_embed)
-    for emoji in reaction_roles["dm_status"]:
-        await dm_status_message.add_reaction(emoji)
-
-    # Color Roles Embed
-    color_embed = discord.Embed(
-        title="Color",
-        description="\n".join(
-            [f"{emoji}: `{role}`" for emoji, role in reaction_roles["color"].items()]
-        ),
-        color=discord.Color.teal()
-    )
-    color_embed.set_footer(text="React to set your display color.")
-    color_message = await roles_channel.send(embed=color_embed)
-    for emoji in reaction_roles["color"]:
-        await color_message.add_reaction(emoji)
 
-    await ctx.send("Reaction roles setup complete!")
+    messages = {}
+    changes = collections.Counter()
+    failed = []
+    for category, result in zip(categories, results):
+        if isinstance(result, discord.HTTPException):
+            print(f"Could not set up the {category} role message: {result}")
+            failed.append(REACTION_ROLE_EMBEDS[category]["title"])
+            if category in known:
+                messages[category] = known[category]  # Try it again next time
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        message, changed = result
+        messages[category] = message.id
+        changes.update(changed)
+        if known.get(category) not in (None, message.id):
+            reaction_role_index.unregister(ctx.guild, known[category])  # Its message was deleted
+        reaction_role_index.register(ctx.guild, category, message.id)
+    await role_message_store.save(ctx.guild.id, messages)
+
+    summary = f"{changes['posted']} posted, {changes['updated']} updated, {changes['reactions']} reactions added"
+    if failed:
+        await ctx.send(f"Reaction roles setup incomplete ({summary}). Failed: {', '.join(failed)}.")
+    else:
+        await ctx.send(f"Reaction roles setup complete! ({summary})")
+
+QUIZ_LENGTH = 5  # Questions per quiz
+
+class TriviaPool:
+    """
+    Open Trivia Database questions prefetched per (category, difficulty).
+    Each pool is refilled in the background in batches of up to 50 questions
+    with a session token, so the same question isn't served twice until the
+    token is exhausted (then it is reset). Questions are unescaped and their
+    options shuffled once, when they arrive. opentdb allows one request every
+    5 seconds, so all requests go through one paced lane. The least recently
+    used pools are dropped when the total number of questions goes over
+    `max_questions`.
+    """
 
-# Global variables to manage quiz state
-quiz_active = False
+    API_URL = "https://opentdb.com/api.php"
+    TOKEN_URL = "https://opentdb.com/api_token.php"
+    DIFFICULTIES = {None, "easy", "medium", "hard"}
+    CATEGORIES = {None, *range(9, 33)}  # The IDs listed by !quiz_categories
+    MIN_INTERVAL = 5.5  # Seconds between the starts of two requests to opentdb (it allows one per 5 s), across all processes
+
+    def __init__(self, capacity=50, low_water=2 * QUIZ_LENGTH, max_questions=2000):
+        self.capacity = capacity
+        self.low_water = low_water
+        self.max_questions = max_questions
+        self.pools = collections.OrderedDict()  # (category, difficulty) -> PrefetchPool, least recently used first
+        self.token = None
+        self._lane = asyncio.Lock()
+
+    async def _request(self, url, params):
+        async with self._lane:
+            delay = await shared_state.reserve("opentdb", self.MIN_INTERVAL)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await http_client.get_json(url, params=params)
+
+    async def _session_token(self):
+        if self.token is None:
+            try:
+                status, data = await self._request(self.TOKEN_URL, {"command": "request"})
+            except HTTP_ERRORS:
+                return None  # Questions without a token may repeat, but the quiz still works
+            if status == 200 and data.get("response_code") == 0:
+                self.token = data["token"]
+        return self.token
+
+    @staticmethod
+    def _parse(item):
+        answer = html.unescape(item["correct_answer"]).lower()  # Decode and lowercase correct answer
+        question = {
+            "question": html.unescape(item["question"]),  # Decode question text
+            "answer": answer,
+            "options": [html.unescape(ans).lower() for ans in item["incorrect_answers"]] + [answer]
+        }
+        random.shuffle(question["options"])  # Shuffle options for variety
+        return question
+
+    async def _fetch(self, key, amount):
+        category, difficulty = key
+        for _ in range(4):  # A few recoveries (new token, reset token, smaller batch), never an endless loop
+            params = {"amount": min(amount, 50)}
+            if category:
+                params["category"] = category
+            if difficulty:
+                params["difficulty"] = difficulty
+            token = await self._session_token()
+            if token:
+                params["token"] = token
+            status, data = await self._request(self.API_URL, params)
+            if status != 200:
+                return []
+            code = data.get("response_code")
+            if code == 0:
+                return [self._parse(item) for item in data["results"]]
+            if code == 1 and amount > QUIZ_LENGTH:
+                amount = QUIZ_LENGTH  # Not enough questions left for a big batch
+            elif code == 3:
+                self.token = None  # Token expired after 6 hours of inactivity
+            elif code == 4 and token:
+                await self._request(self.TOKEN_URL, {"command": "reset", "token": token})  # Seen every question
+            elif code == 5:
+                continue  # Rate limited: the next request waits its turn in the lane
+            else:
+                return []  # 1: no questions for this filter, 2: invalid category or difficulty
+        return []
+
+    def _pool(self, category, difficulty):
+        key = (category, difficulty)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = PrefetchPool(lambda amount: self._fetch(key, amount), self.capacity, self.low_water)
+            # Keep memory bounded: forget the least recently used pools
+            while len(self.pools) > 1 and sum(map(len, self.pools.values())) + self.capacity > self.max_questions:
+                _, evicted = self.pools.popitem(last=False)
+                evicted.discard()
+        self.pools.move_to_end(key)
+        return pool
+
+    def warm(self, category=None, difficulty=None):
+        """Start filling a pool ahead of the first quiz."""
+        self._pool(category, difficulty).refill()
+
+    async def draw(self, category, difficulty, count):
+        """Return up to `count` questions. Waits on the API only if the pool is empty."""
+        difficulty = difficulty.lower() if difficulty else None
+        if difficulty not in self.DIFFICULTIES or category not in self.CATEGORIES:
+            return []  # Would only create a pool that stays empty
+        return await self._pool(category, difficulty).take_or_wait(count)
+
+    async def close(self):
+        for pool in self.pools.values():
+            await pool.close()
+
+trivia_pool = TriviaPool()
+
+QUIZ_QUESTION_TIMEOUT = 60  # Seconds before an unanswered question is revealed and skipped
 quiz_channel_name = "🤔quiz"
-quiz_scores = {}
-quiz_questions = []  # Placeholder for questions (to be loaded or fetched later)
-current_question = None
+
+class TimerWheel:
+    """
+    Hashed timer wheel: one background task drives every timeout. A timer is
+    dropped into the slot `delay` ticks ahead of the cursor (plus full rounds
+    for long delays), and each tick fires the callbacks of one slot, so
+    scheduling and cancelling are O(1) no matter how many timers exist.
+    Callbacks are plain functions run on the event loop; they start tasks for
+    anything that has to await.
+    """
+
+    def __init__(self, tick=1.0, slots=128):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.cursor = 0
+        self._task = None
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) after about `delay` seconds. Returns a handle for cancel()."""
+        ticks = max(1, math.ceil(delay / self.tick))
+        rounds, offset = divmod(ticks - 1, len(self.slots))
+        timer = [rounds, callback, args]
+        self.slots[(self.cursor + offset + 1) % len(self.slots)].append(timer)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return timer
+
+    @staticmethod
+    def cancel(timer):
+        timer[1] = None  # Dropped when its slot comes up
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while any(self.slots):
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))  # Catch up instead of drifting
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            slot = self.slots[self.cursor]
+            due = [timer for timer in slot if timer[0] == 0]
+            slot[:] = [timer for timer in slot if timer[0] > 0 and timer[1] is not None]
+            for timer in slot:
+                timer[0] -= 1
+            for _, callback, args in due:
+                if callback is not None:
+                    try:
+                        callback(*args)
+                    except Exception as e:
+                        print(f"Timer callback failed: {e}")
+
+class QuizSession:
+    """One running quiz in one channel. answer() is synchronous, so two correct answers can never both win a question."""
+
+    CORRECT = "correct"
+    WRONG = "wrong"
+    INVALID = "invalid"
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.questions = collections.deque()
+        self.scores = {}  # user_id -> points
+        self.current = None  # Question being asked, None between questions
+        self.number = 0  # Questions asked so far; stale timers compare against it
+        self.timer = None
+        self._replies = {}  # Normalized reply -> True if it wins the current question
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.lower().split())
+
+    def next_question(self):
+        """Move to the next question and return it, or None when the quiz has run out."""
+        self.current = self.questions.popleft() if self.questions else None
+        if self.current is None:
+            return None
+        self.number += 1
+        answer = self.normalize(self.current["answer"])
+        self._replies = {str(i): self.normalize(option) == answer  # Options can also be picked by number
+                         for i, option in enumerate(self.current["options"], start=1)}
+        self._replies[answer] = True  # Last, so a numeric answer ("4") always beats an option number
+        return self.current
+
+    def close_question(self):
+        self.current = None
+        if self.timer is not None:
+            TimerWheel.cancel(self.timer)
+            self.timer = None
+
+    def answer(self, user_id, text):
+        """Check a reply to the current question: CORRECT (and score it), WRONG, INVALID, or None if no question is open."""
+        if self.current is None:
+            return None
+        reply = self.normalize(text)
+        correct = self._replies.get(reply)
+        if correct:
+            self.scores[user_id] = self.scores.get(user_id, 0) + 1
+            self.close_question()
+            return self.CORRECT
+        if correct is None and reply.isdigit():
+            return self.INVALID
+        return self.WRONG
+
+class QuizManager:
+    """Running quizzes keyed by (guild_id, channel_id), so every channel can host its own quiz."""
+
+    def __init__(self, question_timeout=QUIZ_QUESTION_TIMEOUT):
+        self.question_timeout = question_timeout
+        self.sessions = {}
+        self.wheel = TimerWheel()
+        self._tasks = set()  # Running question_timed_out tasks, referenced so they can't be garbage-collected
+
+    @staticmethod
+    def key(channel):
+        return (getattr(channel.guild, "id", None), channel.id)
+
+    def get(self, channel):
+        return self.sessions.get(self.key(channel))
+
+    def start(self, channel):
+        """Reserve the channel for a new quiz. Returns None if one is already running there."""
+        key = self.key(channel)
+        if key in self.sessions:
+            return None
+        session = self.sessions[key] = QuizSession(channel)
+        return session
+
+    def end(self, channel):
+        session = self.sessions.pop(self.key(channel), None)
+        if session is not None:
+            session.close_question()
+        return session
+
+    def running(self, session):
+        """True while `session` is the channel's quiz, i.e. it was neither ended nor replaced."""
+        return self.sessions.get(self.key(session.channel)) is session
+
+    def finish(self, session):
+        """Unregister a quiz that ran out of questions, unless it was already ended."""
+        if self.running(session):
+            self.end(session.channel)
+
+    def start_timer(self, session):
+        session.timer = self.wheel.schedule(self.question_timeout, self._expire, session, session.number)
+
+    def _expire(self, session, number):
+        if session.current is not None and session.number == number and self.running(session):
+            answer = session.current["answer"]
+            session.close_question()
+            task = asyncio.create_task(question_timed_out(session, answer))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+quiz_manager = QuizManager()
 
 # Command to start the quiz
 @bot.command()
 @commands.has_permissions(manage_guild=True)
 async def start_quiz(ctx, category: int = None, difficulty: str = None):
-    # Fetches questions from the Open Trivia Database API. If no category or difficulty is provided, defaults are used.
-    global quiz_active, quiz_scores, quiz_questions, current_question
+    # Draws questions from the prefetched Open Trivia Database pool. If no category or difficulty is provided, defaults are used.
 
     # Ensure the command is run in the designated quiz channel
     if ctx.channel.name != quiz_channel_name:
         await ctx.send(f"⚠️ This command can only be used in the `{quiz_channel_name}` channel.")
         return
 
-    # Prevent multiple quizzes from running simultaneously
-    if quiz_active:
+    # Prevent multiple quizzes from running simultaneously in the same channel
+    session = quiz_manager.start(ctx.channel)
+    if session is None:
         await ctx.send("🚨 A quiz is already running! Use `!end_quiz` to stop the current quiz.")
         return
 
-    # Initialize the quiz
-    quiz_active = True
-    quiz_scores = {}
-    quiz_questions = []
-
-    # Base API URL for Open Trivia Database
-    api_url = "https://opentdb.com/api.php?amount=5"
-    
-    # Add category and difficulty filters if provided
-    if category:
-        api_url += f"&category={category}"
-    if difficulty:
-        api_url += f"&difficulty={difficulty.lower()}"
-    
-    # Fetch questions from the API
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_url) as response:
-            if response.status == 200:
-                data = await response.json()
-                if data["response_code"] == 0:  # Successful response
-                    for item in data["results"]:
-                        question = {
-                            "question": html.unescape(item["question"]),  # Decode question text
-                            "answer": html.unescape(item["correct_answer"]).lower(),  # Decode and lowercase correct answer
-                            "options": [html.unescape(ans).lower() for ans in item["incorrect_answers"]] + [html.unescape(item["correct_answer"]).lower()]
-                        }
-                        random.shuffle(question["options"])  # Shuffle options for variety
-                        quiz_questions.append(question)
-                else:
-                    await ctx.send("⚠️ Failed to fetch quiz questions. Please try again later.")
-                    quiz_active = False
-                    return
-            else:
-                await ctx.send("⚠️ Unable to connect to the trivia API. Please try again later.")
-                quiz_active = False
-                return
+    # Questions come from the prefetched pool; only a cold pool waits on the API
+    session.questions.extend(await trivia_pool.draw(category, difficulty, QUIZ_LENGTH))
+    if not quiz_manager.running(session):
+        return  # Ended with !end_quiz while the questions were being fetched
+    if not session.questions:
+        await ctx.send("⚠️ Failed to fetch quiz questions. Please try again later.")
+        quiz_manager.finish(session)
+        return
 
-    current_question = None
     await ctx.send("🎉 **Quiz started!** Mods or Admins can end it using `!end_quiz`. Get ready!")
-    await send_next_question(ctx)
+    await send_next_question(session)
 
-async def send_next_question(ctx):
+async def send_next_question(session):
     # Sends the next question in the quiz. If no questions remain, announces the end of the quiz.
-    global quiz_questions, current_question
-
-    if not quiz_questions:
-        await ctx.send("🎉 **Quiz finished!** No more questions available.")
+    if not quiz_manager.running(session):
+        return  # Ended in the meantime
+    question = session.next_question()
+    if question is None:
+        quiz_manager.finish(session)  # Frees the channel for the next quiz
+        await send_reply(session.channel, "🎉 **Quiz finished!** No more questions available. Here are the final scores:")
+        await send_final_scores(session)
         return
 
-    current_question = quiz_questions.pop(0)
-    options = "\n".join([f"{i+1}. {option}" for i, option in enumerate(current_question["options"])])
-    await ctx.send(f"❓ **Question:** {current_question['question']}\n\n{options}")
+    quiz_manager.start_timer(session)
+    options = "\n".join([f"{i+1}. {option}" for i, option in enumerate(question["options"])])
+    await send_reply(session.channel, f"❓ **Question:** {question['question']}\n\n{options}")
+
+async def question_timed_out(session, answer):
+    # Reveals the answer of a question nobody found in time and moves on.
+    await send_reply(session.channel, f"⏰ **Time's up!** The answer was **{answer}**.")
+    await send_next_question(session)
 
 # Command to end the quiz
 @bot.command()
 @commands.has_permissions(manage_guild=True)
 async def end_quiz(ctx):
-    global quiz_active, quiz_scores
-
     # Ensure the command is run in the designated quiz channel
     if ctx.channel.name != quiz_channel_name:
         await ctx.send(f"⚠️ This command can only be used in the `{quiz_channel_name}` channel.")
         return
 
     # Check if a quiz is active
-    if not quiz_active:
+    session = quiz_manager.end(ctx.channel)
+    if session is None:
         await ctx.send("⚠️ No quiz is currently running!")
         return
 
-    quiz_active = False
     await ctx.send("🚨 **Quiz ended!** Here are the final scores:")
+    await send_final_scores(session)
 
+async def send_final_scores(session):
     # Display final scores
-    if quiz_scores:
-        leaderboard = sorted(quiz_scores.items(), key=lambda x: x[1], reverse=True)
-        score_message = "\n".join([f"**{i+1}. {bot.get_user(int(user)).name}** - {score} points"
+    if session.scores:
+        leaderboard = sorted(session.scores.items(), key=lambda x: x[1], reverse=True)
+        names = await name_resolver.resolve(user for user, _ in leaderboard)
+        score_message = "\n".join([f"**{i+1}. {names[int(user)]}** - {score} points"
                                    for i, (user, score) in enumerate(leaderboard)])
-        await ctx.send(f"🏆 **Final Leaderboard** 🏆\n{score_message}")
+        await send_reply(session.channel, f"🏆 **Final Leaderboard** 🏆\n{score_message}")
     else:
-        await ctx.send("No one participated in the quiz. 😢")
+        await send_reply(session.channel, "No one participated in the quiz. 😢")
+
+# Weather responses are cached per city so bursts of the same question cost one API call
+WEATHER_CACHE_TTL = float(os.getenv("TURBO_WEATHER_CACHE_TTL", "600"))  # Seconds a response stays fresh
+WEATHER_CACHE_SIZE = int(os.getenv("TURBO_WEATHER_CACHE_SIZE", "512"))  # Cities kept, least recently used dropped first
+weather_cache = TTLCache(WEATHER_CACHE_SIZE, WEATHER_CACHE_TTL)
+weather_flights = SingleFlight()
+
+async def fetch_weather(city):
+    """Return (status, data) for a city, from the cache when possible. Only 200 and 404 answers are cached."""
+    key = " ".join(city.lower().split())  # "  New   York" and "new york" are the same question
+    cached = weather_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        shared = await shared_state.get("weather", key) if PROCESS_COUNT > 1 else None  # Another process may have asked already
+        if shared is not None:
+            result = tuple(shared)
+            weather_cache.set(key, result)
+            return result
+
+        # OpenWeather API configuration
+        api_key = os.getenv("OPENWEATHER_API_KEY")
+        base_url = "https://api.openweathermap.org/data/2.5/weather"
+        params = {"q": key, "appid": api_key, "units": "metric"}
+        result = await http_client.get_json(base_url, params=params)
+        if result[0] in (200, 404):
+            weather_cache.set(key, result)
+            if PROCESS_COUNT > 1:
+                await shared_state.set("weather", key, result, ttl=WEATHER_CACHE_TTL)
+        return result
+
+    return await weather_flights.run(key, fetch)
 
 # Command to fetch the current weather
 @bot.command()
@@ -784,42 +3699,227 @@ async def weather(ctx, *, city: str):
     Usage: !weather [city]
     Example: !weather London
     """
-    # OpenWeather API configuration
-    api_key = os.getenv("OPENWEATHER_API_KEY")
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
-    
-    # Construct API URL
-    params = {"q": city, "appid": api_key, "units": "metric"}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(base_url, params=params) as response:
-            if response.status == 200:
-                data = await response.json()
-                # Extract weather data
-                city_name = data["name"]
-                weather_description = data["weather"][0]["description"].capitalize()
-                temperature = data["main"]["temp"]
-                feels_like = data["main"]["feels_like"]
-                humidity = data["main"]["humidity"]
-                wind_speed = data["wind"]["speed"]
-                
-                # Create and send an embedded message
-                embed = discord.Embed(
-                    title=f"Weather in {city_name}",
-                    description=f"{weather_description}",
-                    color=discord.Color.blue()
-                )
-                embed.add_field(name="Temperature", value=f"{temperature}°C", inline=True)
-                embed.add_field(name="Feels Like", value=f"{feels_like}°C", inline=True)
-                embed.add_field(name="Humidity", value=f"{humidity}%", inline=True)
-                embed.add_field(name="Wind Speed", value=f"{wind_speed} m/s", inline=True)
-                embed.set_footer(text="Data provided by OpenWeather")
-                
-                await ctx.send(embed=embed)
-            elif response.status == 404:
-                await ctx.send("City not found. Please check the spelling and try again. 🌍")
-            else:
-                await ctx.send("Sorry, I couldn't fetch the weather data right now. Please try again later. 😢")
+    try:
+        status, data = await fetch_weather(city)
+    except HTTP_ERRORS:
+        status = None
+    if status == 200:
+        # Extract weather data
+        city_name = data["name"]
+        weather_description = data["weather"][0]["description"].capitalize()
+        temperature = data["main"]["temp"]
+        feels_like = data["main"]["feels_like"]
+        humidity = data["main"]["humidity"]
+        wind_speed = data["wind"]["speed"]
+        
+        # Create and send an embedded message
+        embed = discord.Embed(
+            title=f"Weather in {city_name}",
+            description=f"{weather_description}",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Temperature", value=f"{temperature}°C", inline=True)
+        embed.add_field(name="Feels Like", value=f"{feels_like}°C", inline=True)
+        embed.add_field(name="Humidity", value=f"{humidity}%", inline=True)
+        embed.add_field(name="Wind Speed", value=f"{wind_speed} m/s", inline=True)
+        embed.set_footer(text="Data provided by OpenWeather")
+        
+        await ctx.send(embed=embed)
+    elif status == 404:
+        await ctx.send("City not found. Please check the spelling and try again. 🌍")
+    else:
+        await ctx.send("Sorry, I couldn't fetch the weather data right now. Please try again later. 😢")
+
+# Command to inspect outbound HTTP health
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def http_stats(ctx):
+    """Shows request, retry and error counts and latency per upstream API."""
+    stats = http_client.stats()
+    lines = [
+        f"`{host}`: {c['requests']} requests, {c['retries']} retries, {c['errors']} errors, "
+        f"avg {c['avg_ms']} ms, max {c['max_ms']} ms"
+        for host, c in stats.items()
+    ] or ["No outbound HTTP requests yet."]
+    cache = weather_cache.stats()
+    lines.append(
+        f"Weather cache: {cache['size']} cities, {cache['hits']} hits, {cache['misses']} misses, "
+        f"{weather_flights.coalesced} coalesced"
+    )
+    await ctx.send("**🌐 Outbound HTTP**\n" + "\n".join(lines))
+
+# Gauges read when /metrics is scraped
+metrics.gauge("turbo_levels_store", levels_store.stats, "Levels storage flushes and pending changes")
+metrics.gauge("turbo_deletion_queue", deletion_queue.stats, "Moderation bulk-delete queue")
+metrics.gauge("turbo_mod_log", mod_log.stats, "Batched moderation log delivery")
+metrics.gauge("turbo_level_up_notifier", level_up_notifier.stats, "Level-up announcement worker")
+metrics.gauge("turbo_outbound", outbound.stats, "Outbound Discord request scheduler")
+metrics.gauge("turbo_joins", join_pipeline.stats, "Join raid handling")
+metrics.gauge("turbo_member_cache", member_chunker.stats, "Cached members and lazy chunking")
+metrics.gauge("turbo_weather_cache", weather_cache.stats, "Weather response cache")
+metrics.gauge("turbo_name_cache", name_resolver.cache.stats, "User name cache")
+metrics.gauge("turbo_quiz_sessions", lambda: len(quiz_manager.sessions), "Running quizzes")
+metrics.gauge("turbo_guilds", lambda: len(bot.guilds), "Guilds the bot is in")
+if SHARDED:
+    metrics.gauge("turbo_shard_latency_seconds", lambda: {str(shard_id): latency for shard_id, latency in bot.latencies},
+                  "Gateway heartbeat latency per shard")
+
+def format_latencies(title, summary):
+    lines = [f"**{title}** (count, avg, p95)"]
+    for label, (count, avg, p95) in sorted(summary.items()):
+        p95_text = f"{p95 * 1000:g} ms" if p95 != float("inf") else "> 10 s"
+        lines.append(f"- `{label or 'all'}`: {count}, {avg * 1000:.2f} ms, ≤ {p95_text}")
+    return lines
+
+# Command to summarize the bot's health
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def stats(ctx):
+    """Summarizes handler latencies, queues and caches."""
+    uptime = datetime.timedelta(seconds=int(time.time() - metrics.started))
+    lines = [f"**📊 TURBO stats** — uptime {uptime}, {len(bot.guilds)} guilds, gateway latency {bot.latency * 1000:.0f} ms"]
+    if SHARDED:
+        shards = ", ".join(f"{shard_id}: {latency * 1000:.0f} ms" for shard_id, latency in bot.latencies)
+        lines.append(f"**Shards** ({bot.shard_count} in total; this process: {shards})")
+    if metrics.enabled:
+        lines += format_latencies("on_message stages", metrics.summary("turbo_on_message_stage_seconds"))
+        lines += format_latencies("Commands", metrics.summary("turbo_command_seconds"))
+        lines += format_latencies("Outbound HTTP", metrics.summary("turbo_http_request_seconds"))
+        lines += format_latencies("Discord queue wait", metrics.summary("turbo_outbound_wait_seconds"))
+        lines += format_latencies("Event loop lag", metrics.summary("turbo_event_loop_lag_seconds"))
+    else:
+        lines.append("Latency instrumentation is off (set `TURBO_METRICS_ENABLED=1`).")
+    for name, component in (("Levels store", levels_store), ("Deletion queue", deletion_queue),
+                            ("Moderation log", mod_log), ("Audit log", audit_log), ("Outbound", outbound),
+                            ("Joins", join_pipeline), ("Level-ups", level_up_notifier),
+                            (f"Member cache ({CACHE_PROFILE})", member_chunker)):
+        fields = ", ".join(f"{key} {value}" for key, value in component.stats().items())
+        lines.append(f"**{name}**: {fields}")
+    for chunk in chunk_lines(lines, 2000):
+        await ctx.send(chunk)
+
+class TaggedStream:
+    """Wraps stdout so each line starts with `tag`, telling apart the output of the bot processes."""
+
+    def __init__(self, stream, tag):
+        self.stream = stream
+        self.tag = tag
+        self._line_start = True
+
+    def write(self, text):
+        for line in text.splitlines(keepends=True):
+            if self._line_start:
+                self.stream.write(self.tag)
+            self.stream.write(line)
+            self._line_start = line.endswith("\n")
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def recommended_shards():
+    """Ask Discord for the recommended shard count and how many shards may identify at once."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {TOKEN}", "User-Agent": "TURBO launcher"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        data = json.load(response)
+    return data["shards"], data["session_start_limit"]["max_concurrency"]
+
+def shard_ranges(shard_count, processes):
+    """Split shard IDs 0..shard_count-1 into at most `processes` contiguous ranges of nearly equal size."""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (index < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+def launch(argv):
+    """
+    Run the bot as several worker processes, each an AutoShardedBot for its own
+    range of shards. Workers share the levels database and the state database,
+    get their own metrics port, and are restarted with a growing delay if they
+    crash. Starts are staggered so the shards identify within Discord's limit.
+    """
+    parser = argparse.ArgumentParser(prog="turbo.py launch", description="Run TURBO as several sharded processes.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per core)")
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT, help="total shards (default: Discord's recommendation)")
+    args = parser.parse_args(argv)
+
+    max_concurrency = 1  # Shards that may identify in the same 5 seconds
+    shard_count = args.shards
+    if not shard_count:
+        shard_count, max_concurrency = recommended_shards()
+    ranges = shard_ranges(shard_count, args.processes)
+    print(f"Launching {shard_count} shards in {len(ranges)} processes")
+
+    def spawn(index):
+        env = dict(
+            os.environ,
+            TURBO_SHARD_COUNT=str(shard_count),
+            TURBO_SHARD_IDS=",".join(map(str, ranges[index])),
+            TURBO_PROCESS_COUNT=str(len(ranges)),
+            TURBO_METRICS_PORT=str(METRICS_PORT + index),
+        )
+        print(f"Starting worker {index} (shards {format_shard_ids(ranges[index])})")
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # Stop the workers on SIGTERM as on Ctrl+C
+    workers = [None] * len(ranges)
+    started_at = [0.0] * len(ranges)
+    restart_at = [0.0] * len(ranges)
+    failures = [0] * len(ranges)
+    try:
+        for index in range(len(ranges)):
+            workers[index] = spawn(index)
+            started_at[index] = time.monotonic()
+            if index < len(ranges) - 1:
+                time.sleep(5 * len(ranges[index]) / max_concurrency)  # Let its shards identify first
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for index, worker in enumerate(workers):
+                if worker is None:
+                    if now >= restart_at[index]:
+                        workers[index] = spawn(index)
+                        started_at[index] = now
+                    continue
+                code = worker.poll()
+                if code is None:
+                    continue
+                failures[index] = 1 if now - started_at[index] > 300 else failures[index] + 1  # Reset after a good run
+                delay = min(300, 5 * 2 ** (failures[index] - 1))
+                print(f"Worker {index} (shards {format_shard_ids(ranges[index])}) exited with code {code}, restarting in {delay}s")
+                workers[index] = None
+                restart_at[index] = now + delay
+    except KeyboardInterrupt:
+        print("Stopping workers...")
+    finally:
+        running = [worker for worker in workers if worker is not None and worker.poll() is None]
+        for worker in running:
+            worker.terminate()
+        for worker in running:
+            try:
+                worker.wait(timeout=30)  # Time to save the levels data
+            except subprocess.TimeoutExpired:
+                worker.kill()
 
 # Run the bot
-bot.run(TOKEN)
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["migrate-levels"]: # One-shot copy of levels.json into the SQLite database
+        count = migrate_levels_json()
+        print(f"Migrated {count} users from {LEVELS_FILE} to {LEVELS_DB}.")
+    elif sys.argv[1:2] == ["launch"]: # Sharded deployment over several processes
+        launch(sys.argv[2:])
+    else:
+        if SHARD_TAG:
+            sys.stdout = TaggedStream(sys.stdout, f"[{SHARD_TAG}] ")
+            log_formatter = logging.Formatter(f"[{SHARD_TAG}] %(asctime)s %(levelname)-8s %(name)s %(message)s", "%Y-%m-%d %H:%M:%S")
+            bot.run(TOKEN, log_formatter=log_formatter)
+        else:
+            bot.run(TOKEN)